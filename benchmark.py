@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+
+import time
+import tracemalloc
+import numpy as np
+
+from sound_shift_fft import SoundShiftFFT
+from ext_feature_base import moving_average
+import fft_backend
+
+#==========================================================================
+# run func and return (result, elapsed time [s], peak traced memory [bytes])
+def measure(func, *args, **kwargs):
+    tracemalloc.start()
+    start = time.perf_counter()
+    ret = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return ret, elapsed, peak
+
+#----------------------------------------------------------------------
+# best-of-N timing
+def bench(func, repeats, *args, **kwargs):
+    results = [measure(func, *args, **kwargs) for i in range(repeats)]
+    best = min(results, key=lambda x: x[1])
+    return best[0], best[1], max([r[2] for r in results])
+
+#----------------------------------------------------------------------
+def report(name, elapsed, peak, base_elapsed=None):
+    line = "%-24s %9.3f s %10.1f MB" % (name, elapsed, peak / 2**20)
+    if base_elapsed is not None:
+        line += "  x%.2f" % (base_elapsed / elapsed)
+    print(line)
+    return
+
+#==========================================================================
+# fft_all before strided framing: copy-based frames and tiled window
+def fft_all_copy(s):
+    shift_data1 = np.empty([s.folds, s.max_offset, s.shift], dtype=np.float64)
+    shift_data2 = np.empty(shift_data1.shape, dtype=np.float64)
+    for cnt in range(s.folds):
+        shift_data1[cnt,:,:] = s.data1[cnt:-s.folds+cnt,:]
+        shift_data2[cnt,:,:] = s.data2[cnt:-s.folds+cnt,:]
+    shift_data1 = shift_data1.transpose([1,0,2]).reshape(-1, s.winsize)
+    shift_data2 = shift_data2.transpose([1,0,2]).reshape(-1, s.winsize)
+
+    win = np.tile(np.hamming(s.winsize), [shift_data1.shape[0], 1])
+
+    return np.fft.rfft(win * shift_data1), np.fft.rfft(win * shift_data2)
+
+#----------------------------------------------------------------------
+def fft_all(s):
+    s.fft_all()
+    return s.fft_data1, s.fft_data2
+
+#----------------------------------------------------------------------
+def bench_fft(args):
+    rs = np.random.RandomState(0)
+    samples = int(args.duration * args.samp_rate)
+    data1 = rs.randn(samples)
+    data2 = rs.randn(samples)
+
+    print("fft_all: %.0f s, fft_len=%d, fft_shift=%d" % (args.duration, args.fft_len, args.fft_shift))
+    s = SoundShiftFFT(data1, data2, args.samp_rate, args.fft_len, args.fft_shift)
+    ref, base_elapsed, peak = bench(fft_all_copy, args.repeats, s)
+    report("copy + tiled window", base_elapsed, peak)
+
+    ret, elapsed, peak = bench(fft_all, args.repeats, s)
+    report("strided + broadcast", elapsed, peak, base_elapsed)
+    print("max abs diff: %g" % max(np.max(np.abs(ref[0] - ret[0])), np.max(np.abs(ref[1] - ret[1]))))
+
+    return
+
+#----------------------------------------------------------------------
+def bench_backend(args):
+    rs = np.random.RandomState(0)
+    samples = int(args.duration * args.samp_rate)
+    data1 = rs.randn(samples)
+    data2 = rs.randn(samples)
+
+    print("fft_all backends: %.0f s, fft_len=%d, fft_shift=%d, workers=%s" % (
+        args.duration, args.fft_len, args.fft_shift, args.workers))
+    base_elapsed = None
+    for backend in fft_backend.available_backends():
+        s = SoundShiftFFT(data1, data2, args.samp_rate, args.fft_len, args.fft_shift,
+                          fft_backend=backend.name, fft_workers=args.workers)
+        ret, elapsed, peak = bench(fft_all, args.repeats, s)
+        report(backend.name, elapsed, peak, base_elapsed)
+        if base_elapsed is None:
+            base_elapsed = elapsed
+
+    s = SoundShiftFFT(data1[:args.fft_len*2], data2[:args.fft_len*2], args.samp_rate,
+                      args.fft_len, args.fft_shift, fft_backend='auto', fft_workers=args.workers)
+    print("auto: %s" % s.fft.name)
+
+    return
+
+#----------------------------------------------------------------------
+# feature extractor on a generated stereo signal with vehicles passing at random
+def generated_vehicles(args, extf_module):
+    rs = np.random.RandomState(0)
+    samples = int(args.duration * args.samp_rate)
+    ext = extf_module.ExtFeature(win       = args.winsize,
+                                 cutoff    = args.cutoff,
+                                 fft_len   = args.fft_len,
+                                 fft_shift = args.fft_shift,
+                                 )
+    s = SoundShiftFFT(rs.randn(samples), rs.randn(samples), args.samp_rate,
+                      args.fft_len, args.fft_shift,
+                      max_bin=ext.max_bin(args.samp_rate))
+    s.fft_all()
+    ext.set_signal(s)
+
+    t0 = rs.uniform(args.winsize, args.duration - args.winsize, args.vehicles)
+    v  = rs.uniform(5, 20, args.vehicles) * rs.choice([-1, 1], args.vehicles)
+    return ext, t0, v
+
+#----------------------------------------------------------------------
+def bench_merge(args):
+    import ext_feature_shift_fft
+    ext, t0, v = generated_vehicles(args, ext_feature_shift_fft)
+
+    def per_vehicle():
+        return [ext.extract_feature(t0[i], v[i]) for i in range(len(t0))]
+
+    print("shift_merge_fft: %d vehicles, winsize=%.1f s, fft_len=%d, fft_shift=%d" % (
+        args.vehicles, args.winsize, args.fft_len, args.fft_shift))
+    ref, base_elapsed, peak = bench(per_vehicle, args.repeats)
+    report("per vehicle", base_elapsed, peak)
+    ret, elapsed, peak = bench(ext.extract_features, args.repeats, t0, v)
+    report("batched", elapsed, peak, base_elapsed)
+    print("max abs diff: %g" % np.max(np.abs(np.array(ref) - ret[0])))
+
+    return
+
+#----------------------------------------------------------------------
+# moving average before vectorization: np.convolve for each column
+def moving_average_convolve(features, winsize):
+    ret = np.empty([features.shape[0]-winsize+1, features.shape[1]], dtype=features.dtype)
+    ma_win = (np.ones(winsize) / winsize).astype(features.real.dtype)
+    for i in range(features.shape[1]):
+        ret[:,i] = np.convolve(np.real(features[:,i]), ma_win, mode='valid') \
+          + np.convolve(np.imag(features[:,i]), ma_win, mode='valid')*1j
+    return ret
+
+#----------------------------------------------------------------------
+def bench_ma(args):
+    import ext_feature_shift_fft
+    ext, t0, v = generated_vehicles(args, ext_feature_shift_fft)
+    features, mask = ext.extract_features(t0, v)
+
+    print("moving average: %d vehicles x %d frames x %d bins" % features.shape)
+    for ma_len in range(10, 31, 5):
+        print("ma_len=%d" % ma_len)
+        ref, base_elapsed, peak = bench(lambda: [moving_average_convolve(f, ma_len) for f in features],
+                                        args.repeats)
+        report("convolve per column", base_elapsed, peak)
+        ret, elapsed, peak = bench(moving_average, args.repeats, features, ma_len)
+        report("cumsum all at once", elapsed, peak, base_elapsed)
+        print("max rel diff: %g" % (np.max(np.abs(np.array(ref) - ret)) / np.max(np.abs(ret))))
+
+    return
+
+#==========================================================================
+# handle arguments
+def arg_parser():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument("target", type=str, action="store",
+                    choices=["fft", "backend", "merge", "ma"],
+                    help="benchmark target",
+                    )
+    ap.add_argument("-d", "--duration", type=float, action="store",
+                    default=60.0,
+                    help="length of generated stereo signal in second",
+                    )
+    ap.add_argument("-r", "--samp_rate", type=float, action="store",
+                    default=48e3,
+                    help="sampling rate",
+                    )
+    ap.add_argument("-l", "--fft_len", type=int, action="store",
+                    default=2048,
+                    help="FFT window size",
+                    )
+    ap.add_argument("-s", "--fft_shift", type=int, action="store",
+                    default=256,
+                    help="FFT shift length",
+                    )
+    ap.add_argument("-n", "--repeats", type=int, action="store",
+                    default=3,
+                    help="number of runs (best time is reported)",
+                    )
+    ap.add_argument("-w", "--workers", type=int, action="store",
+                    default=None,
+                    help="number of threads for FFT backends (default: all cores)",
+                    )
+    ap.add_argument("-v", "--vehicles", type=int, action="store",
+                    default=1000,
+                    help="number of generated vehicles",
+                    )
+    ap.add_argument("--winsize", type=float, action="store",
+                    default=2.0,
+                    help="window size for each vehicle in second",
+                    )
+    ap.add_argument("--cutoff", type=float, action="store",
+                    default=3e3,
+                    help="LPF cutoff frequency",
+                    )
+    return ap
+
+#==========================================================================
+if __name__ == '__main__':
+    parser = arg_parser()
+    args = parser.parse_args()
+
+    targets = {
+        "fft": bench_fft,
+        "backend": bench_backend,
+        "merge": bench_merge,
+        "ma": bench_ma,
+        }
+    targets[args.target](args)
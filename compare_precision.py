@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+
+from main import load_class, create_ext_feature, create_vehicles
+
+#======================================================================
+# 引数処理
+def arg_parser():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-c", "--conffile", type=str, action="store",
+                    default="config.py",
+                    help="config file",
+                    )
+    ap.add_argument("-r", "--random_state", type=int, action="store",
+                    default=0,
+                    help="random state for resampling and cross-validation (default: 0)",
+                    )
+    ap.add_argument("-o", "--output", type=str, action="store",
+                    default=None,
+                    help="report output file name",
+                    )
+    return ap
+
+#----------------------------------------------------------------------
+# 指定した精度で特徴量抽出と交差検証を実行
+def run(config, precision, random_state):
+    extf_class = load_class(config.ext_feature_class)
+    est_class  = load_class(config.est_class)
+
+    ret = {'precision': precision}
+
+    start = time.perf_counter()
+    ext = create_ext_feature(extf_class, config, precision=precision)
+    ext.load_sound(config.wavfile)
+    veh = create_vehicles(config, ext)
+    veh.load_data()
+    if 'pre_vehicle' in list(config.__dict__.keys()):
+        config.pre_vehicle(veh)
+
+    fd, result_file = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    try:
+        e = est_class.Estimate(vehicles    = veh,
+                               result_file = result_file,
+                               workers     = getattr(config, 'cv_workers', 1),
+                               **getattr(config, 'est_params', {})
+                               )
+        e.feature_extraction()
+        ret['feature_time'] = time.perf_counter() - start
+        ret['features'] = e.dataset.features
+        ret['labels'] = e.dataset.labels
+
+        start = time.perf_counter()
+        e.validate(folds=config.folds, repeat=config.repeats, random_state=random_state)
+        ret['validate_time'] = time.perf_counter() - start
+
+        e.load_result(result_file)
+        e.finalize()
+    finally:
+        os.remove(result_file)
+    ret['accuracy'] = e.final_accuracy
+
+    return ret
+
+#----------------------------------------------------------------------
+# 倍精度と単精度の結果を比較したレポートを作成
+def report(double, single):
+    x_d = double['features']
+    x_s = single['features'].astype(np.float64)
+    abs_err = np.abs(x_d - x_s)
+    rel_err = abs_err / np.maximum(np.abs(x_d), np.finfo(np.float32).tiny)
+    label_mismatch = np.count_nonzero(double['labels'] != single['labels'])
+
+    lines = []
+    lines.append("%-20s %14s %14s" % ("", "double", "single"))
+    lines.append("%-20s %14s %14s" % ("feature dtype",
+                                       double['features'].dtype, single['features'].dtype))
+    lines.append("%-20s %12.1fMB %12.1fMB" % ("feature size",
+                                              double['features'].nbytes / 2**20,
+                                              single['features'].nbytes / 2**20))
+    lines.append("%-20s %13.2fs %13.2fs" % ("feature time",
+                                            double['feature_time'], single['feature_time']))
+    lines.append("%-20s %13.2fs %13.2fs" % ("validate time",
+                                            double['validate_time'], single['validate_time']))
+    lines.append("%-20s %14.4f %14.4f" % ("accuracy",
+                                          double['accuracy'], single['accuracy']))
+    lines.append("")
+    lines.append("accuracy difference (single - double): %+.4f" % (single['accuracy'] - double['accuracy']))
+    lines.append("feature max abs error: %g" % abs_err.max())
+    lines.append("feature max rel error: %g" % rel_err.max())
+    lines.append("feature mean rel error: %g" % rel_err.mean())
+    lines.append("label mismatches: %d" % label_mismatch)
+
+    return "\n".join(lines) + "\n"
+
+#======================================================================
+if __name__ == '__main__':
+    parser = arg_parser()
+    args = parser.parse_args()
+
+    # 設定ファイル読み込み
+    try:
+        config = load_class(args.conffile)
+    except ImportError:
+        sys.stderr.write('Error: Ignore missing config file "' + args.conffile + '"\n')
+        sys.exit(1)
+
+    results = [run(config, precision, args.random_state) for precision in ['double', 'single']]
+    text = report(*results)
+
+    print(text)
+    if args.output is not None:
+        print("report saved in %s" % args.output)
+        with open(args.output, "w") as f:
+            f.write(text)
@@ -32,6 +32,21 @@ outdir = "result"
 
 # 推定クラスのファイル名
 est_class = "estimate_svm.py"
+#   メモリに収まらない特徴量はmini-batchでSGD学習する推定クラスを使う
+# est_class = "estimate_sgd.py"
+#   非線形SVMはカーネル行列をブロック単位で計算する推定クラスを使う
+#   (scale_whole_dataset=Trueの場合はデータセット全体で標準化したカーネル行列を全foldで共有する)
+# est_class = "estimate_svm_kernel.py"
+#   行数が多い場合はカーネル近似 (random Fourier features / Nystroem) + 線形SVMの推定クラスを使う
+# est_class = "estimate_svm_approx.py"
+
+# 推定クラスに渡す追加のパラメータ (dict)
+#   例: estimate_sgd.pyの場合 {'batch_size': 4096, 'epochs': 5}
+#       estimate_svm_kernel.pyの場合 {'kernel': 'rbf', 'C': 1.0}
+#         ({'scale_whole_dataset': True, 'gram_dir': 'gram'} でカーネル行列を保存・再利用)
+#       estimate_svm_approx.pyの場合 {'approx': 'rff', 'n_components': 500, 'C': 1.0}
+#       estimate_svm_split.pyの場合 {'split': ({'recording': [0, 1]}, {'recording': 2})}
+est_params = {}
 
 # 特徴量抽出クラスのファイル名
 ext_feature_class = "ext_feature_shift_fft.py"
@@ -47,12 +62,26 @@ vehicle_info = "../data/MAH00092_follow_vehicle_sensing_L2_notruck.tsv"
 # 車両走行音wavファイル
 wavfile = "../data/MAH00092.wav"
 
+# 複数の録音を使う場合のmanifestファイル
+#   wavfile, vehicle_info列を持つTSVファイル (相対パスはmanifestファイルからの相対)
+#   指定した場合はwavfileとvehicle_infoは使わない
+#   Noneの場合は使わない
+manifest = None
+
+# manifestの録音ごとに特徴量を抽出するプロセス数 (int)
+#   Noneの場合はCPUコア数，1の場合は並列化しない
+dataset_workers = None
+
 # 交差検証の分割数 (int)
 folds = 10
 
 # 交差検証の繰り返し数 (int)
 repeats = 1
 
+# 交差検証の各foldを並列に学習・評価するプロセス数 (int)
+#   1の場合は並列化しない，-1の場合はCPUコア数
+cv_workers = 1
+
 # confusion matrixのプロット出力有無
 #   True:   デフォルトファイル名 (例: 20190124_1855_result.png)
 #   False:  出力しない
@@ -76,6 +105,91 @@ ma_len = 10
 # FFT結果に対する移動平均のwindow移動を重ねるか
 ma_overlap = True
 
+# FFTをブロックに分割して計算する際のメモリ上限 [byte] (int)
+#   Noneの場合は全区間を一括でFFT
+fft_mem_limit = None
+
+# FFT結果をmemmapファイルとして保存するディレクトリ
+#   Noneの場合はメモリ上に保持
+#   長時間の録音ではfft_mem_limitと合わせて指定するとメモリ使用量を抑えられる
+fft_mmap_dir = None
+
+# 車両通過時刻周辺のFFTのみを計算するか
+#   Trueの場合はvehicle_infoの各車両のwindowが参照するFFT offsetのみ計算する
+#   (fft_mmap_dirは使われない)
+fft_lazy = False
+
+# FFT結果のキャッシュを保存するディレクトリ
+#   同じwavファイル・fft_len・fft_shiftのFFT結果を複数回の実行で共有する
+#   Noneの場合はキャッシュしない
+fft_cache_dir = None
+
+# FFT結果のキャッシュの最大サイズ [byte] (int)
+#   超えた場合は最後に使われたのが古いものから削除
+#   Noneの場合は無制限
+fft_cache_size = None
+
+# FFT結果のキャッシュに保存する最大周波数 [Hz]
+#   グリッドサーチで使うcutoffの最大値を指定するとキャッシュのサイズを抑えられる
+#   Noneの場合は全周波数
+fft_cache_cutoff = None
+
+# FFT結果・特徴量の演算精度
+#   'double': float64/complex128
+#   'single': float32/complex64 (メモリ使用量が半分になる)
+precision = 'double'
+
+# FFTの計算方法
+#   'numpy':  numpy.fft (1スレッド)
+#   'scipy':  scipy.fft (fft_workersスレッドで並列計算)
+#   'pyfftw': pyFFTW (要インストール，fft_workersスレッドで並列計算)
+#   'auto':   使用可能なものから最初に計測して最も速いものを選ぶ
+fft_backend = 'numpy'
+
+# FFTに使うスレッド数 (int)
+#   Noneの場合はCPUコア数
+fft_workers = None
+
+# pyFFTWのwisdom (FFTのplan) を保存するファイル
+#   終了時にまとめて保存する．Noneの場合は保存しない
+fft_wisdom = None
+
+# 多数の車両の遅延曲線 (S-curve) を計算する際の一時メモリの上限 [byte] (int)
+#   Noneの場合は一度に計算
+delay_mem_limit = None
+
+# 遅延曲線をキャッシュする速度の刻み [m/s]
+#   速度をこの刻みに丸め，同じ速度の車両で遅延曲線を共有する (近似)
+#   一括抽出，車両ごとの抽出，stream_classifyのいずれにも適用される
+#   Noneの場合は車両ごとに正確に計算
+delay_v_step = None
+
+# キャッシュする遅延曲線の最大数 (int)
+delay_cache_size = 1024
+
+# 特徴量抽出の並列数 (int)
+#   Noneまたは1の場合は並列化しない
+feature_workers = None
+
+# 特徴量抽出の並列化方法
+#   'thread':  スレッドで並列化 (FFT結果・特徴量はメモリ上で共有)
+#   'process': プロセス (fork) で並列化 (FFT結果はcopy-on-write，特徴量はmemmapで共有)
+feature_pool = 'thread'
+
+# 特徴量をまとめて抽出する車両数 (int)
+#   大きくするとメモリ使用量が増える
+feature_batch = 4
+
+# 車両ごとの特徴量を保存して再利用するディレクトリ
+#   wavファイル・車両 (t0, v)・特徴量抽出のパラメータが同じ場合は再計算しない
+#   Noneの場合は保存しない
+feature_store_dir = None
+
+# 保存する特徴量の最大サイズ [byte] (int)
+#   超えた場合は最後に使われたのが古いものから削除
+#   Noneの場合は無制限
+feature_store_size = None
+
 #----------------------------------------------------------------------
 # fft_shiftのチェック
 if fft_len % fft_shift != 0:
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+
+import os
+import shutil
+import tempfile
+import concurrent.futures
+import numpy as np
+import pandas as pd
+
+import vehicles
+from feature_dataset import FeatureDataset, FeatureDatasetWriter
+
+#==========================================================================
+# extract features of a recording in a worker process
+#   FeatureDataset of the recording is saved with base name part_base
+#   returns (rows, columns, dtype) of features
+def extract_recording(conffile, recording, wavfile, vehicle_info, vehicle_types, part_base):
+    from main import load_class, create_ext_feature, create_vehicles
+
+    config = load_class(conffile)
+    ext = create_ext_feature(load_class(config.ext_feature_class), config)
+    print("load sound data %s" % wavfile)
+    ext.load_sound(wavfile)
+
+    veh = create_vehicles(config, ext,
+                          vehicle_info  = vehicle_info,
+                          vehicle_types = vehicle_types,
+                          recording     = recording,
+                          )
+    veh.load_data()
+    if 'pre_vehicle' in list(config.__dict__.keys()):
+        config.pre_vehicle(veh)
+
+    ds = veh.calc_dataset()
+    ds.save(part_base)
+
+    return ds.features.shape[0], ds.features.shape[1], ds.features.dtype.str
+
+#==========================================================================
+# vehicles in many recordings listed in a manifest file
+#   manifest is a TSV file with wavfile and vehicle_info columns
+#   (relative paths are relative to the manifest file)
+#   recording id is the row number in manifest
+#   features are extracted per recording in worker processes and consolidated
+#   into a FeatureDataset saved with base name out_base and loaded as memmap
+#   can be used in place of Vehicles for Estimate
+class Dataset():
+    def __init__(self,
+                 manifest,      # manifest file
+                 conffile,      # config file for feature extraction
+                 out_base,      # base name for consolidated feature files
+                 workers=None,  # number of worker processes (None: number of CPUs, 1: no workers)
+                 ):
+        self.manifest_file = manifest
+        self.conffile = conffile
+        self.out_base = out_base
+        self.workers  = workers
+
+        self.manifest = None
+        self.data     = None
+        self.type_ids = None
+
+        return
+
+    #----------------------------------------------------------------------
+    def load_manifest(self):
+        self.manifest = pd.read_csv(self.manifest_file,
+                                    sep="\t",
+                                    comment="#",
+                                    header=0,
+                                    )
+        base_dir = os.path.dirname(os.path.abspath(self.manifest_file))
+        for col in ['wavfile', 'vehicle_info']:
+            self.manifest[col] = [os.path.join(base_dir, f) for f in self.manifest[col]]
+        if len(self.manifest) == 0:
+            raise ValueError("no recordings in manifest %s" % self.manifest_file)
+        return
+
+    #----------------------------------------------------------------------
+    # load vehicle information of all recordings
+    #   type ids are shared among recordings
+    def load_data(self):
+        from main import load_class
+        config = load_class(self.conffile)
+
+        if self.manifest is None:
+            self.load_manifest()
+
+        # vehicle types in order of appearance in all recordings
+        vehicle_types = []
+        for vehicle_info in self.manifest.vehicle_info:
+            veh = vehicles.Vehicles(vehicle_info)
+            veh.load_data()
+            vehicle_types += [t for t in veh.type_ids.values() if t not in vehicle_types]
+        self.type_ids = dict(zip(range(len(vehicle_types)), vehicle_types))
+
+        data = []
+        for recording, vehicle_info in enumerate(self.manifest.vehicle_info):
+            veh = vehicles.Vehicles(vehicle_info, vehicle_types=vehicle_types, recording=recording)
+            veh.load_data()
+            if 'pre_vehicle' in list(config.__dict__.keys()):
+                config.pre_vehicle(veh)
+            veh.data['recording']  = recording
+            veh.data['vehicle_id'] = veh.data.index
+            data.append(veh.data)
+        self.data = pd.concat(data, ignore_index=True)
+
+        return
+
+    #----------------------------------------------------------------------
+    # feature matrix of vehicles in all recordings (in manifest order)
+    #   each row is a feature vector followed by type_id
+    def calc_features(self):
+        return self.calc_dataset().matrix()
+
+    #----------------------------------------------------------------------
+    # append parts of tasks into FeatureDataset saved with base name out_base
+    #   shapes: (rows, columns, dtype) of each part in order of tasks
+    def consolidate(self, tasks, shapes):
+        writer = None
+        try:
+            for task, shape in zip(tasks, shapes):
+                if writer is None:
+                    writer = FeatureDatasetWriter(self.out_base, shape[1], np.dtype(shape[2]),
+                                                  FeatureDataset.label_dtype(len(self.type_ids)))
+                part = FeatureDataset.load(task[-1])
+                writer.append(part)
+                del part
+                for field in FeatureDataset.fields:
+                    os.remove("%s_%s.npy" % (task[-1], field))
+            if writer.rows == 0:
+                raise ValueError("no feature rows in recordings of manifest %s" % self.manifest_file)
+        except BaseException:
+            if writer is not None:
+                writer.remove()
+            raise
+        writer.close()
+        return
+
+    #----------------------------------------------------------------------
+    # FeatureDataset of vehicles in all recordings (in manifest order)
+    def calc_dataset(self):
+        if self.data is None:
+            self.load_data()
+
+        vehicle_types = [self.type_ids[i] for i in range(len(self.type_ids))]
+        out_dir = os.path.dirname(os.path.abspath(self.out_base))
+        part_dir = tempfile.mkdtemp(dir=out_dir)
+        try:
+            tasks = [(self.conffile, recording, rec.wavfile, rec.vehicle_info, vehicle_types,
+                      os.path.join(part_dir, "%d" % recording))
+                     for recording, rec in enumerate(self.manifest.itertuples())]
+
+            # extract features of each recording and consolidate in manifest order
+            #   each part is consolidated as soon as it and all earlier parts are done
+            #   and its files are removed at once
+            if self.workers == 1:
+                self.consolidate(tasks, (extract_recording(*task) for task in tasks))
+            else:
+                with concurrent.futures.ProcessPoolExecutor(self.workers) as ex:
+                    futures = [ex.submit(extract_recording, *task) for task in tasks]
+                    try:
+                        self.consolidate(tasks, (f.result() for f in futures))
+                    except BaseException:
+                        for f in futures:
+                            f.cancel()
+                        raise
+        finally:
+            shutil.rmtree(part_dir, ignore_errors=True)
+
+        return FeatureDataset.load(self.out_base)
+
+#==========================================================================
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+
+import threading
+import collections
+import numpy as np
+
+#==========================================================================
+# S-curve model of sound delay between the two mics
+#   delay(t) = ( sqrt((v(t-t0) + D/2)^2 + L^2) - sqrt((v(t-t0) - D/2)^2 + L^2) ) / c
+#   curves are evaluated by broadcasting in chunks of rows to bound memory
+class DelayModel():
+    def __init__(self,
+                 D=0.5,           # mic separation
+                 L=2.0,           # distance between road the mic
+                 c=340.0,         # sound speed in air
+                 mem_limit=None,  # memory budget for temporary arrays in bytes (None: at once)
+                 v_step=None,     # velocity quantization step for curve cache (None: exact)
+                 cache_size=1024, # maximum number of cached curves
+                 ):
+        self.D = D
+        self.L = L
+        self.c = c
+        self.mem_limit  = mem_limit
+        self.v_step     = v_step
+        self.cache_size = cache_size
+
+        # cached curves for quantized velocities
+        #   valid only for the relative time vector rel_t
+        self.rel_t  = None
+        self.curves = collections.OrderedDict()
+        # curves are shared among threads extracting features
+        self.lock   = threading.Lock()
+        return
+
+    #----------------------------------------------------------------------
+    # number of rows evaluated at once
+    def chunk_rows(self, n_rows, n_cols):
+        if self.mem_limit is None:
+            return max(n_rows, 1)
+        # output and about 3 temporaries of the same size per row
+        return max(int(self.mem_limit // (n_cols * 8 * 4)), 1)
+
+    #----------------------------------------------------------------------
+    # delays of N vehicles
+    #   t: N x len matrix or len vector shared by all vehicles
+    #   v and t0: N elements
+    #   each row is identical to the scalar model with v[i] and t0[i]
+    def __call__(self, t, v, t0):
+        t  = np.asarray(t)
+        v  = np.atleast_1d(np.asarray(v, dtype=np.float64))
+        t0 = np.atleast_1d(np.asarray(t0, dtype=np.float64))
+        ret = np.empty([len(v), t.shape[-1]], dtype=np.float64)
+
+        step = self.chunk_rows(len(v), t.shape[-1])
+        for s in range(0, len(v), step):
+            e = min(s + step, len(v))
+            tc = t[s:e] if t.ndim == 2 else t
+            vt = v[s:e,np.newaxis] * (tc - t0[s:e,np.newaxis])
+            ret[s:e] = ( np.sqrt( (vt + self.D/2)**2 + self.L**2 )
+                         - np.sqrt( (vt - self.D/2)**2 + self.L**2 ) ) / self.c
+        return ret
+
+    #----------------------------------------------------------------------
+    # delays of N vehicles on the same relative time vector rel_t (= t - t0)
+    #   velocities are rounded to multiples of v_step and their curves are cached
+    #   exact (not cached) if v_step is None
+    def lookup(self, rel_t, v):
+        v = np.atleast_1d(np.asarray(v, dtype=np.float64))
+        if self.v_step is None:
+            return self(rel_t, v, np.zeros(len(v)))
+
+        q = np.round(v / self.v_step).astype(np.int64)
+        q_uniq, inv = np.unique(q, return_inverse=True)
+
+        with self.lock:
+            # curves are valid only for the same time vector
+            if self.rel_t is None or not np.array_equal(self.rel_t, rel_t):
+                self.rel_t = np.array(rel_t, dtype=np.float64)
+                self.curves.clear()
+
+            # calculate curves not in cache
+            missing = [k for k in q_uniq if k not in self.curves]
+            if len(missing) > 0:
+                missing = np.array(missing)
+                new = self(self.rel_t, missing * self.v_step, np.zeros(len(missing)))
+                for k, curve in zip(missing, new):
+                    self.curves[k] = curve
+
+            table = np.empty([len(q_uniq), len(self.rel_t)], dtype=np.float64)
+            for i, k in enumerate(q_uniq):
+                table[i] = self.curves[k]
+                self.curves.move_to_end(k)
+
+            # drop least recently used curves
+            while len(self.curves) > self.cache_size:
+                self.curves.popitem(last=False)
+
+        return table[inv.reshape(-1)]
+
+#==========================================================================
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+
+import numpy as np
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import confusion_matrix
+from sklearn.preprocessing import StandardScaler
+
+import estimate_svm
+
+#==========================================================================
+# out-of-core estimation with linear SVM trained by SGD
+#   features are read from the dataset (np.ndarray or memmap)
+#   in mini-batches of batch_size rows, so the peak memory is bounded by
+#   batch_size instead of the number of rows
+class Estimate(estimate_svm.Estimate):
+    def __init__(self,
+                 vehicles=None,    # vehicle information class instance
+                 result_file=None, # output filename for results
+                 score_file=None,  # output filename for test score
+                 workers=1,        # number of parallel workers for validation (-1: all CPUs)
+                 batch_size=4096,  # number of rows in a mini-batch
+                 epochs=5,         # number of passes over training data
+                 ):
+        super(Estimate, self).__init__(vehicles, result_file, score_file, workers)
+        self.batch_size = batch_size
+        self.epochs     = epochs
+        return
+
+    #----------------------------------------------------------------------
+    def define_model(self, random_state=None):
+        # release model
+        del self.model
+        # reload model
+        self.model = SGDClassifier(loss='hinge', alpha=1e-4, random_state=random_state)
+
+        return self.model
+
+    #----------------------------------------------------------------------
+    # mini-batches of rows idx of x (default: all rows)
+    #   rows in a batch are read in ascending order to read memmap sequentially
+    def batches(self, x, idx=None):
+        if idx is None:
+            idx = np.arange(x.shape[0])
+        for start in range(0, len(idx), self.batch_size):
+            batch = np.sort(idx[start:start+self.batch_size])
+            yield batch, x[batch]
+
+    #----------------------------------------------------------------------
+    # train model with streaming feature scaling
+    #   rows idx of x and y are used (default: all rows)
+    #   all the extracted features are used if x and y are omitted
+    def fit(self, x=None, y=None, idx=None):
+        if x is None:
+            x = self.dataset.features
+            y = self.dataset.labels
+        if idx is None:
+            idx = np.arange(x.shape[0])
+        y = np.asarray(y)
+
+        # recompile model
+        self.define_model(self.random_state)
+
+        # feature scaling with streaming mean and variance
+        self.scaler = StandardScaler()
+        for batch, x_batch in self.batches(x, idx):
+            self.scaler.partial_fit(x_batch)
+
+        # training in mini-batches (shuffled in each epoch)
+        classes = np.unique(y[idx])
+        rs = np.random.RandomState(self.random_state)
+        for epoch in range(self.epochs):
+            for batch, x_batch in self.batches(x, rs.permutation(idx)):
+                self.model.partial_fit(self.scaler.transform(x_batch), y[batch], classes=classes)
+
+        return self.model
+
+    #----------------------------------------------------------------------
+    def predict(self, x, idx=None):
+        return np.concatenate([self.model.predict(self.scaler.transform(x_batch))
+                               for batch, x_batch in self.batches(x, idx)])
+
+    #----------------------------------------------------------------------
+    # train with rows train_idx and evaluate with rows test_idx of x
+    def eval_indices(self, x, y, train_idx, test_idx):
+        # training
+        self.fit(x, y, train_idx)
+        train_idx = np.sort(train_idx)
+        test_score = np.mean(self.predict(x, train_idx) == y[train_idx])
+
+        # estimation
+        test_idx = np.sort(test_idx)
+        y_est = self.predict(x, test_idx)
+
+        # generate confusion matrix
+        conf_mat = confusion_matrix(y[test_idx], y_est, labels=np.unique(y))
+
+        return test_score, conf_mat
+
+#==========================================================================
+if __name__ == '__main__':
+    pass
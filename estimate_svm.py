@@ -29,15 +29,33 @@
 
 import os
 import sys
+import copy
+import pickle
 import numpy as np
 import importlib
+from joblib import Parallel, delayed
 from sklearn import svm
 from sklearn.metrics import confusion_matrix
 from sklearn.model_selection import StratifiedKFold
 from sklearn.preprocessing import StandardScaler
-from imblearn.under_sampling import RandomUnderSampler
 
 import conf_mat_plotting
+from feature_dataset import FeatureDataset
+
+#==========================================================================
+# kernel coefficient for features standardized by scaler
+#   gamma='scale' is resolved as SVC does on the standardized features:
+#   1 / (features * variance) with variance 1 of each column (0 if constant)
+def kernel_gamma(gamma, scaler):
+    if gamma == 'scale':
+        return 1.0 / max(np.count_nonzero(scaler.var_ > 0), 1)
+    return float(gamma)
+
+#==========================================================================
+# train and evaluate a fold (in a worker)
+#   x and y are shared among folds (memory-mapped read-only by joblib if large)
+def eval_fold(estimate, x, y, train_idx, test_idx):
+    return estimate.eval_indices(x, y, train_idx, test_idx)
 
 #==========================================================================
 class Estimate(conf_mat_plotting.ConfMatPlotting):
@@ -45,16 +63,22 @@ class Estimate(conf_mat_plotting.ConfMatPlotting):
                  vehicles=None,    # vehicle information class instance
                  result_file=None, # output filename for results
                  score_file=None,  # output filename for test score
+                 workers=1,        # number of parallel workers for validation (-1: all CPUs)
                  ):
         super(Estimate, self).__init__()
         self.vehicles    = vehicles
         self.result_file = result_file
         self.score_file  = score_file
+        self.workers     = workers
 
         self.model       = None # machine learning model
+        self.scaler      = None # feature scaler for model
         self.classes     = None # number of classes (labels)
-        # feature matrix: features, label (= vehicle type id)
-        self.feature_matrix = None
+        self.random_state = None # random state for model and data splitting
+        # FeatureDataset: features, labels (= vehicle type id) and ids
+        self.dataset = None
+        # (train indices, test indices) into dataset of each fold in validation
+        self.splits = None
 
         return
 
@@ -62,7 +86,7 @@ class Estimate(conf_mat_plotting.ConfMatPlotting):
     def feature_extraction(self):
         # calculate features
         print("calculate features")
-        self.feature_matrix = self.vehicles.calc_features()
+        self.dataset = self.vehicles.calc_dataset()
 
         # number of classes (labels)
         self.classes = len(self.vehicles.data.type.unique())
@@ -80,55 +104,149 @@ class Estimate(conf_mat_plotting.ConfMatPlotting):
 
     #----------------------------------------------------------------------
     def eval(self, x_train, y_train, x_test, y_test):
-        # recompile model
-        self.define_model()
-
-        # feature scaling
-        scaler = StandardScaler()
-        x_train_scaled = scaler.fit_transform(x_train)
-        x_test_scaled  = scaler.transform(x_test)
-
         # training
-        self.model.fit(x_train_scaled, y_train)
-        test_score = self.model.score(x_train_scaled, y_train)
+        self.fit(x_train, y_train)
+        test_score = self.model.score(self.scaler.transform(x_train), y_train)
 
         # estimation
-        y_est = self.model.predict(x_test_scaled)
+        y_est = self.predict(x_test)
 
         # generate confusion matrix
         conf_mat = confusion_matrix(y_test, y_est)
 
         return test_score, conf_mat
 
+    #----------------------------------------------------------------------
+    # train with rows train_idx and evaluate with rows test_idx of x
+    def eval_indices(self, x, y, train_idx, test_idx):
+        return self.eval(x[train_idx], y[train_idx], x[test_idx], y[test_idx])
+
+    #----------------------------------------------------------------------
+    # train model with feature scaling
+    #   all the extracted features are used if x and y are omitted
+    def fit(self, x=None, y=None):
+        if x is None:
+            x = self.dataset.features
+            y = self.dataset.labels
+
+        # feature scaling
+        self.scaler = StandardScaler()
+        x_scaled = self.scaler.fit_transform(x)
+
+        # recompile model
+        self.define_model(self.random_state)
+
+        # training
+        self.model.fit(x_scaled, y)
+
+        return self.model
+
+    #----------------------------------------------------------------------
+    def predict(self, x):
+        return self.model.predict(self.scaler.transform(x))
+
+    #----------------------------------------------------------------------
+    # save trained model and feature scaler
+    def save_model(self, model_file, type_ids=None):
+        with open(model_file, 'wb') as f:
+            pickle.dump({'model':    self.model,
+                         'scaler':   self.scaler,
+                         'type_ids': type_ids,
+                         }, f)
+        return True
+
+    #----------------------------------------------------------------------
+    # load trained model and feature scaler
+    #   returns vehicle type names for type ids
+    def load_model(self, model_file):
+        with open(model_file, 'rb') as f:
+            saved = pickle.load(f)
+        self.model  = saved['model']
+        self.scaler = saved['scaler']
+        return saved['type_ids']
+
+    #----------------------------------------------------------------------
+    # data indexed by rows of dataset and passed to eval_indices in validation
+    def validation_features(self):
+        return self.dataset.features
+
     #----------------------------------------------------------------------
     def validate(self, folds=10, repeat=1, random_state=None):
+        self.random_state = random_state
         # data
-        x = self.feature_matrix[:,:-1]
+        x = self.validation_features()
         # label
-        y = self.feature_matrix[:,-1]
+        y = self.dataset.labels
 
         # folded validation
-        skf = StratifiedKFold(n_splits=folds, shuffle=True)
+        skf = StratifiedKFold(n_splits=folds, shuffle=True, random_state=random_state)
 
-        count = 0
-        uniq, counts = np.unique(y, return_counts=True)
-        counts[:] = np.min(counts)
-        sampler = RandomUnderSampler(ratio=dict(zip(uniq, counts)), random_state=random_state)
+        rs = np.random.RandomState(random_state)
+        self.splits = []
         for rep in range(repeat):
-            # resample data to balance the training/test data
+            # balance the training/test data by indices into feature matrix
             print("resample data to balance")
-            x_resamp, y_resamp = sampler.fit_sample(x, y)
+            idx = self.balanced_indices(y, rs)
+
+            for train_idx, test_idx in skf.split(np.zeros([len(idx), 1]), y[idx]):
+                self.splits.append((idx[train_idx], idx[test_idx]))
+        tasks = [(x, y, train_idx, test_idx) for train_idx, test_idx in self.splits]
+
+        # results are saved in fold order
+        for count, (score, conf_mat) in enumerate(self.run_tasks(eval_fold, tasks)):
+            print("iter=%d" % count)
+            self.save_result(conf_mat)
+            self.save_score(score)
+
+        return True
 
-            for train_idx, test_idx in skf.split(x_resamp, y_resamp):
-                print("iter=%d" % count)
-                score, conf_mat = self.eval(x_resamp[train_idx], y_resamp[train_idx],
-                                            x_resamp[test_idx],  y_resamp[test_idx])
-                self.save_result(conf_mat)
-                self.save_score(score)
-                count += 1
+    #----------------------------------------------------------------------
+    # sorted indices of y balanced by under-sampling the other classes to the smallest class
+    #   rs: np.random.RandomState
+    @staticmethod
+    def balanced_indices(y, rs):
+        uniq, counts = np.unique(y, return_counts=True)
+        idx = [rs.choice(np.flatnonzero(y == label), np.min(counts), replace=False)
+               for label in uniq]
+        return np.sort(np.concatenate(idx))
+
+    #----------------------------------------------------------------------
+    # save indices into dataset of each fold in validation to reproduce or audit it
+    #   train_<n> and test_<n> arrays of fold n are saved in npz file
+    def save_splits(self, splits_file):
+        if splits_file is None or self.splits is None:
+            return False
+
+        arrays = {}
+        for count, (train_idx, test_idx) in enumerate(self.splits):
+            arrays["train_%d" % count] = train_idx
+            arrays["test_%d" % count]  = test_idx
+        np.savez(splits_file, **arrays)
 
         return True
 
+    #----------------------------------------------------------------------
+    # run func(estimate, *task) for each task and return results in task order
+    #   tasks are run in parallel by joblib if workers is not 1
+    def run_tasks(self, func, tasks):
+        if self.workers == 1:
+            return [func(self, *task) for task in tasks]
+
+        est = self.worker_copy()
+        return Parallel(n_jobs=self.workers)(delayed(func)(est, *task) for task in tasks)
+
+    #----------------------------------------------------------------------
+    # copy of this instance sent to workers
+    #   vehicles, datasets and arrays are not sent
+    def worker_copy(self):
+        est = copy.copy(self)
+        est.vehicles = None
+        est.splits   = None
+        for key, value in list(est.__dict__.items()):
+            if isinstance(value, (np.ndarray, FeatureDataset)):
+                setattr(est, key, None)
+        return est
+
     #----------------------------------------------------------------------
     def save_result(self, c_mat):
         if self.result_file is None:
@@ -144,14 +262,16 @@ class Estimate(conf_mat_plotting.ConfMatPlotting):
         return True
 
     #----------------------------------------------------------------------
+    # score is a value or values of a fold saved in a row
     def save_score(self, score):
         if self.score_file is None:
             return False
 
+        score = np.atleast_1d(score).reshape(1, -1)
         with open(self.score_file, 'a') as f:
             np.savetxt(f,
-                       np.array([score]),
-                       fmt=["%f"],
+                       score,
+                       fmt=["%f"]*score.shape[1],
                        delimiter=",",
                        )
 
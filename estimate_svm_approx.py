@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+import time
+import numpy as np
+from sklearn import svm
+from sklearn.kernel_approximation import Nystroem, RBFSampler
+from sklearn.metrics import confusion_matrix
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+import estimate_svm
+
+#==========================================================================
+# nonlinear SVM approximated by a kernel feature mapping and a linear SVM
+#   approx='rff':      random Fourier features of RBF kernel (RBFSampler)
+#                      the random weights do not depend on data, so they are
+#                      drawn once and shared among folds
+#   approx='nystroem': Nystroem approximation with landmarks sampled from
+#                      data, so the mapping is fitted on training rows of
+#                      each fold
+#   features are standardized with training rows of each fold in both cases
+#   training and estimation cost is linear in the number of rows
+#   score of each fold: train score, test accuracy, fit time [s], predict time [s]
+#   (fit and predict times include scaling and mapping)
+class Estimate(estimate_svm.Estimate):
+    def __init__(self,
+                 vehicles=None,    # vehicle information class instance
+                 result_file=None, # output filename for results
+                 score_file=None,  # output filename for test score
+                 workers=1,        # number of parallel workers for validation (-1: all CPUs)
+                 approx='rff',     # kernel approximation: 'rff' or 'nystroem'
+                 n_components=500, # number of features of the mapping
+                 kernel='rbf',     # kernel approximated by 'nystroem'
+                 gamma='scale',    # kernel coefficient ('scale': estimate_svm.kernel_gamma)
+                 C=1.0,            # regularization parameter of linear SVM
+                 block_size=4096,  # number of rows mapped at once
+                 ):
+        super(Estimate, self).__init__(vehicles, result_file, score_file, workers)
+        if approx not in ['rff', 'nystroem']:
+            raise ValueError("unknown kernel approximation %s" % approx)
+        if approx == 'rff' and kernel != 'rbf':
+            raise ValueError("random Fourier features approximate only rbf kernel")
+        self.approx       = approx
+        self.n_components = n_components
+        self.kernel       = kernel
+        self.gamma        = gamma
+        self.C            = C
+        self.block_size   = block_size
+
+        # random Fourier features shared among folds and their key
+        #   (features, n_components, gamma, random_state)
+        self.rff     = None
+        self.rff_key = None
+        return
+
+    #----------------------------------------------------------------------
+    # kernel feature mapping for features standardized by scaler
+    #   random Fourier features are fitted (drawn) here and reused while the
+    #   parameters are unchanged; Nystroem is fitted on training rows in fit()
+    def define_mapping(self, scaler, random_state=None):
+        features = len(scaler.var_)
+        gamma = estimate_svm.kernel_gamma(self.gamma, scaler)
+        if self.approx == 'nystroem':
+            return Nystroem(kernel=self.kernel, gamma=gamma, n_components=self.n_components,
+                            random_state=random_state)
+
+        key = (features, self.n_components, gamma, random_state)
+        if self.rff is None or self.rff_key != key:
+            self.rff = RBFSampler(gamma=gamma, n_components=self.n_components,
+                                  random_state=random_state)
+            self.rff.fit(np.zeros([1, features]))
+            self.rff_key = key
+        return self.rff
+
+    #----------------------------------------------------------------------
+    # model: kernel feature mapping followed by linear SVM
+    #   scaler: feature scaler fitted with training rows (None: self.scaler)
+    def define_model(self, random_state=None, scaler=None):
+        # release model
+        del self.model
+        # reload model
+        #   primal formulation scales to many rows with few features
+        if scaler is None:
+            scaler = self.scaler
+        linear = svm.LinearSVC(C=self.C, dual=False, class_weight='balanced',
+                               random_state=random_state)
+        self.model = Pipeline([('mapping', self.define_mapping(scaler, random_state)),
+                               ('svm', linear)])
+
+        return self.model
+
+    #----------------------------------------------------------------------
+    # standardized and mapped features of x calculated in blocks of rows
+    def map_features(self, x):
+        mapping = self.model.named_steps['mapping']
+        ret = None
+        for start in range(0, x.shape[0], self.block_size):
+            stop = start + self.block_size
+            mapped = mapping.transform(self.scaler.transform(x[start:stop]))
+            if ret is None:
+                ret = np.empty([x.shape[0], mapped.shape[1]], dtype=x.dtype)
+            ret[start:stop] = mapped
+        return ret
+
+    #----------------------------------------------------------------------
+    # train model with feature scaling
+    #   all the extracted features are used if x and y are omitted
+    def fit(self, x=None, y=None):
+        if x is None:
+            x = self.dataset.features
+            y = self.dataset.labels
+
+        # feature scaling
+        self.scaler = StandardScaler()
+        self.scaler.fit(x)
+
+        # recompile model
+        self.define_model(self.random_state)
+
+        # data-dependent mapping
+        if self.approx == 'nystroem':
+            self.model.named_steps['mapping'].fit(self.scaler.transform(x))
+
+        # training
+        self.model.named_steps['svm'].fit(self.map_features(x), y)
+
+        return self.model
+
+    #----------------------------------------------------------------------
+    def predict(self, x):
+        return self.model.named_steps['svm'].predict(self.map_features(x))
+
+    #----------------------------------------------------------------------
+    # train with rows train_idx and evaluate with rows test_idx of x
+    def eval_indices(self, x, y, train_idx, test_idx):
+        x_train = x[train_idx]
+        x_test  = x[test_idx]
+
+        # training
+        start_time = time.perf_counter()
+        self.fit(x_train, y[train_idx])
+        fit_time = time.perf_counter() - start_time
+        train_score = np.mean(self.predict(x_train) == y[train_idx])
+
+        # estimation
+        start_time = time.perf_counter()
+        y_est = self.predict(x_test)
+        predict_time = time.perf_counter() - start_time
+
+        # generate confusion matrix
+        conf_mat = confusion_matrix(y[test_idx], y_est)
+        accuracy = np.trace(conf_mat) / np.sum(conf_mat)
+
+        return np.array([train_score, accuracy, fit_time, predict_time]), conf_mat
+
+    #----------------------------------------------------------------------
+    def save_score(self, score):
+        print("accuracy=%.4f fit time=%.2fs predict time=%.2fs" % tuple(score[1:]))
+        return super(Estimate, self).save_score(score)
+
+#==========================================================================
+if __name__ == '__main__':
+    pass
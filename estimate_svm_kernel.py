@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+import os
+import json
+import hashlib
+import numpy as np
+from sklearn import svm
+from sklearn.metrics import confusion_matrix
+from sklearn.metrics.pairwise import pairwise_kernels
+from sklearn.preprocessing import StandardScaler
+
+import estimate_svm
+
+#==========================================================================
+# nonlinear SVM validated with precomputed kernel (Gram) matrices
+#   Gram matrices are computed in blocks and the folds are trained with
+#   SVC(kernel='precomputed')
+#   by default features of each fold are standardized with its training rows,
+#   and the Gram matrices of the fold are computed in the fold
+#   with scale_whole_dataset=True, features are standardized with the mean and
+#   variance of the whole dataset (test rows of the folds included), and the
+#   Gram matrix of the dataset is computed once and indexed by every fold and
+#   repeat, so fold training includes no kernel evaluation; the Gram matrix
+#   does not depend on C and is reused while the dataset and the kernel
+#   parameters are unchanged (also across runs with gram_dir)
+class Estimate(estimate_svm.Estimate):
+    def __init__(self,
+                 vehicles=None,    # vehicle information class instance
+                 result_file=None, # output filename for results
+                 score_file=None,  # output filename for test score
+                 workers=1,        # number of parallel workers for validation (-1: all CPUs)
+                 kernel='rbf',     # kernel: 'rbf', 'poly', 'sigmoid' or 'linear'
+                 C=1.0,            # regularization parameter
+                 gamma='scale',    # kernel coefficient ('scale': estimate_svm.kernel_gamma)
+                 degree=3,         # degree of 'poly' kernel
+                 coef0=0.0,        # independent term of 'poly' and 'sigmoid' kernels
+                 block_size=4096,  # number of rows of a block in Gram matrix calculation
+                 gram_dir=None,    # directory to save Gram matrices as memmap (None: in memory)
+                 scale_whole_dataset=False, # standardize with whole dataset and share Gram matrix
+                 ):
+        super(Estimate, self).__init__(vehicles, result_file, score_file, workers)
+        self.kernel     = kernel
+        self.C          = C
+        self.gamma      = gamma
+        self.degree     = degree
+        self.coef0      = coef0
+        self.block_size = block_size
+        self.gram_dir   = gram_dir
+        self.scale_whole_dataset = scale_whole_dataset
+
+        # Gram matrix of dataset and its key (dataset, kernel parameters)
+        self.gram     = None
+        self.gram_key = None
+        return
+
+    #----------------------------------------------------------------------
+    # precomputed: the model takes Gram matrices instead of features
+    def define_model(self, random_state=None, precomputed=False):
+        # release model
+        del self.model
+        # reload model
+        if precomputed:
+            self.model = svm.SVC(kernel='precomputed', C=self.C, class_weight='balanced',
+                                 random_state=random_state)
+        else:
+            self.model = svm.SVC(kernel=self.kernel, C=self.C, class_weight='balanced',
+                                 random_state=random_state, **self.kernel_params(self.scaler))
+
+        return self.model
+
+    #----------------------------------------------------------------------
+    # kernel parameters for pairwise_kernels and SVC on features standardized by scaler
+    def kernel_params(self, scaler):
+        if self.kernel == 'linear':
+            return {}
+        params = {'gamma': estimate_svm.kernel_gamma(self.gamma, scaler)}
+        if self.kernel in ['poly', 'sigmoid']:
+            params['coef0'] = float(self.coef0)
+        if self.kernel == 'poly':
+            params['degree'] = int(self.degree)
+        return params
+
+    #----------------------------------------------------------------------
+    # row blocks of x
+    def blocks(self, x):
+        return [(start, min(start + self.block_size, x.shape[0]))
+                for start in range(0, x.shape[0], self.block_size)]
+
+    #----------------------------------------------------------------------
+    # feature scaler fitted with streaming mean and variance of rows of x
+    def fit_scaler(self, x):
+        scaler = StandardScaler()
+        for start, stop in self.blocks(x):
+            scaler.partial_fit(x[start:stop])
+        return scaler
+
+    #----------------------------------------------------------------------
+    # kernel matrix of rows of x and y standardized by scaler into ret
+    #   computed in block pairs; if y is None (y = x), block pairs of the
+    #   upper triangle are computed and mirrored
+    def fill_kernel(self, ret, scaler, params, x, y=None):
+        blocks = self.blocks(x)
+        for i, (i_start, i_stop) in enumerate(blocks):
+            x_i = scaler.transform(x[i_start:i_stop])
+            for j_start, j_stop in (blocks[i:] if y is None else self.blocks(y)):
+                y_j = scaler.transform((x if y is None else y)[j_start:j_stop])
+                k = pairwise_kernels(x_i, y_j, metric=self.kernel, **params)
+                ret[i_start:i_stop, j_start:j_stop] = k
+                if y is None:
+                    ret[j_start:j_stop, i_start:i_stop] = k.T
+        return ret
+
+    #----------------------------------------------------------------------
+    # Gram matrix of features x standardized with x (scale_whole_dataset)
+    #   saved in gram_dir and loaded as memmap if gram_dir is set
+    def calc_gram(self, x):
+        blocks = self.blocks(x)
+
+        # feature scaling with streaming mean and variance
+        scaler = self.fit_scaler(x)
+        params = self.kernel_params(scaler)
+
+        # key of dataset and kernel parameters
+        sha1 = hashlib.sha1(json.dumps([self.kernel, params, x.shape, x.dtype.str]).encode())
+        for start, stop in blocks:
+            sha1.update(np.ascontiguousarray(x[start:stop]).data)
+        key = sha1.hexdigest()[:16]
+        if self.gram is not None and self.gram_key == key:
+            return self.gram
+
+        gram_file = None
+        if self.gram_dir is not None:
+            gram_file = os.path.join(self.gram_dir, "gram_%s.npy" % key)
+            if os.path.exists(gram_file):
+                self.gram, self.gram_key = np.load(gram_file, mmap_mode='r'), key
+                return self.gram
+
+        print("calculate Gram matrix")
+        if gram_file is None:
+            gram = np.empty([x.shape[0], x.shape[0]], dtype=x.dtype)
+        else:
+            os.makedirs(self.gram_dir, exist_ok=True)
+            gram = np.lib.format.open_memmap(gram_file + ".tmp", mode='w+',
+                                             dtype=x.dtype, shape=(x.shape[0], x.shape[0]))
+
+        self.fill_kernel(gram, scaler, params, x)
+
+        if gram_file is not None:
+            gram.flush()
+            del gram
+            os.replace(gram_file + ".tmp", gram_file)
+            gram = np.load(gram_file, mmap_mode='r')
+
+        self.gram, self.gram_key = gram, key
+        return self.gram
+
+    #----------------------------------------------------------------------
+    # Gram matrices of training rows and of test rows against training rows
+    # standardized with the training rows
+    def fold_gram(self, x_train, x_test):
+        scaler = self.fit_scaler(x_train)
+        params = self.kernel_params(scaler)
+        gram_train = np.empty([x_train.shape[0], x_train.shape[0]], dtype=x_train.dtype)
+        gram_test  = np.empty([x_test.shape[0], x_train.shape[0]], dtype=x_train.dtype)
+        return (self.fill_kernel(gram_train, scaler, params, x_train),
+                self.fill_kernel(gram_test, scaler, params, x_test, x_train))
+
+    #----------------------------------------------------------------------
+    # data indexed by rows of dataset in validation:
+    # Gram matrix of dataset with scale_whole_dataset, otherwise features
+    def validation_features(self):
+        if self.scale_whole_dataset:
+            return self.calc_gram(self.dataset.features)
+        return self.dataset.features
+
+    #----------------------------------------------------------------------
+    # train with rows train_idx and evaluate with rows test_idx of
+    # Gram matrix (scale_whole_dataset) or features x
+    def eval_indices(self, x, y, train_idx, test_idx):
+        if self.scale_whole_dataset:
+            gram_train = x[np.ix_(train_idx, train_idx)]
+            gram_test  = x[np.ix_(test_idx, train_idx)]
+        else:
+            gram_train, gram_test = self.fold_gram(x[train_idx], x[test_idx])
+
+        # training
+        self.define_model(self.random_state, precomputed=True)
+        self.model.fit(gram_train, y[train_idx])
+        test_score = self.model.score(gram_train, y[train_idx])
+
+        # estimation
+        y_est = self.model.predict(gram_test)
+
+        # generate confusion matrix
+        conf_mat = confusion_matrix(y[test_idx], y_est)
+
+        return test_score, conf_mat
+
+#==========================================================================
+if __name__ == '__main__':
+    pass
@@ -28,57 +28,130 @@
 # 
 
 import numpy as np
-from imblearn.under_sampling import RandomUnderSampler
 
 import estimate_svm
 
 #==========================================================================
+# boolean mask over vehicle data selecting vehicles by conditions on its columns
+#   column=value:         equal to value
+#   column=(lo, hi):      lo <= column < hi (e.g. t0=(0, 600) for a time range)
+#   column=[v1, v2, ...]: one of the values
+#   column=callable:      callable(column) returns a boolean mask
+#   all conditions must be met
+def select(data, **conditions):
+    mask = np.ones(len(data), dtype=bool)
+    for column, cond in conditions.items():
+        values = np.asarray(data[column])
+        if callable(cond):
+            mask &= np.asarray(cond(values), dtype=bool)
+        elif isinstance(cond, tuple):
+            mask &= (values >= cond[0]) & (values < cond[1])
+        elif isinstance(cond, list):
+            mask &= np.isin(values, cond)
+        else:
+            mask &= values == cond
+    return mask
+
+#----------------------------------------------------------------------
+# split strategies: functions of vehicle data returning (train mask, test mask)
+
+# isolated vehicles for training, simultaneous/successive ones for test
+#   requires Vehicles.num_simul_successive()
+def split_isolated(data):
+    isolated = ~np.asarray(data.is_simul, dtype=bool) & ~np.asarray(data.is_succ, dtype=bool)
+    return isolated, ~isolated
+
+#----------------------------------------------------------------------
+# vehicles meeting train conditions for training and test conditions for test
+#   e.g. split_by(dict(recording=[0, 1]), dict(recording=2))
+#        split_by(dict(t0=(0, 1800)), dict(t0=(1800, np.inf), dir=1))
+def split_by(train, test):
+    def split(data):
+        return select(data, **train), select(data, **test)
+    return split
+
+#==========================================================================
+# estimation trained and tested on vehicles split by a strategy
+#   features are extracted once for all vehicles and each split is a pair of
+#   row index sets into the shared dataset
 class Estimate(estimate_svm.Estimate):
+    def __init__(self,
+                 vehicles=None,    # vehicle information class instance
+                 result_file=None, # output filename for results
+                 score_file=None,  # output filename for test score
+                 workers=1,        # number of parallel workers for validation (-1: all CPUs)
+                 split=split_isolated, # split strategy or (train conditions, test conditions)
+                 ):
+        super(Estimate, self).__init__(vehicles, result_file, score_file, workers)
+        if not callable(split):
+            split = split_by(*split)
+        self.split = split
+        return
 
     #----------------------------------------------------------------------
     def feature_extraction(self):
         # calculate features
         print("calculate features")
-        self.train_matrix = self.vehicles.calc_features(
-            self.vehicles.data.loc[~self.vehicles.data.is_simul &
-                                   ~self.vehicles.data.is_succ
-                                   ])
-        self.test_matrix = self.vehicles.calc_features(
-            self.vehicles.data.loc[self.vehicles.data.is_simul |
-                                   self.vehicles.data.is_succ
-                                   ])
+        self.dataset = self.vehicles.calc_dataset()
 
         # number of classes (labels)
         self.classes = len(self.vehicles.data.type.unique())
 
         return
 
+    #----------------------------------------------------------------------
+    # row indices into dataset of vehicles selected by a boolean mask over vehicle data
+    #   vehicles are identified by (recording, vehicle id)
+    def vehicle_rows(self, mask):
+        data = self.vehicles.data.loc[np.asarray(mask, dtype=bool)]
+        if 'recording' in data:
+            recordings = np.asarray(data.recording, dtype=np.int64)
+        else:
+            recordings = np.full(len(data), self.vehicles.recording, dtype=np.int64)
+        if 'vehicle_id' in data:
+            ids = np.asarray(data.vehicle_id, dtype=np.int64)
+        else:
+            ids = np.asarray(data.index, dtype=np.int64)
+
+        # compare (recording, vehicle id) pairs as single integer keys
+        stride = max(int(np.max(self.dataset.vehicle_ids, initial=0)),
+                     int(np.max(ids, initial=0))) + 1
+        keys = np.asarray(self.dataset.recording_ids) * stride + np.asarray(self.dataset.vehicle_ids)
+        return np.flatnonzero(np.isin(keys, recordings * stride + ids))
+
+    #----------------------------------------------------------------------
+    # (train rows, test rows) into dataset by split strategy (default: self.split)
+    def split_rows(self, split=None):
+        if split is None:
+            split = self.split
+        elif not callable(split):
+            split = split_by(*split)
+        train_mask, test_mask = split(self.vehicles.data)
+        return self.vehicle_rows(train_mask), self.vehicle_rows(test_mask)
+
     #----------------------------------------------------------------------
     def validate(self, folds=None, repeat=1, random_state=None):
+        self.random_state = random_state
         # data
-        train_x = self.train_matrix[:,:-1]
-        test_x  = self.test_matrix[:,:-1]
+        x = self.validation_features()
         # label
-        train_y = self.train_matrix[:,-1]
-        test_y  = self.test_matrix[:,-1]
+        y = self.dataset.labels
 
-        # balance training data
-        uniq, counts = np.unique(train_y, return_counts=True)
-        counts[:] = np.min(counts)
-        sampler1 = RandomUnderSampler(ratio=dict(zip(uniq, counts)), random_state=random_state)
-        uniq, counts = np.unique(test_y, return_counts=True)
-        counts[:] = np.min(counts)
-        sampler2 = RandomUnderSampler(ratio=dict(zip(uniq, counts)), random_state=random_state)
+        train_rows, test_rows = self.split_rows()
 
+        rs = np.random.RandomState(random_state)
+        # (train indices, test indices) into dataset of each repeat
+        self.splits = []
         for rep in range(repeat):
-            # resample data to balance the training/test data
+            # balance the training/test data by indices
             print("resample data to balance")
-            train_x_resamp, train_y_resamp = sampler1.fit_sample(train_x, train_y)
-            test_x_resamp, test_y_resamp   = sampler2.fit_sample(test_x, test_y)
+            self.splits.append((train_rows[self.balanced_indices(y[train_rows], rs)],
+                                test_rows[self.balanced_indices(y[test_rows], rs)]))
+        tasks = [(x, y, train_idx, test_idx) for train_idx, test_idx in self.splits]
 
+        # results are saved in repeat order
+        for rep, (score, conf_mat) in enumerate(self.run_tasks(estimate_svm.eval_fold, tasks)):
             print("iter=%d" % rep)
-            score, conf_mat = self.eval(train_x_resamp, train_y_resamp,
-                                        test_x_resamp,  test_y_resamp)
             self.save_result(conf_mat)
             self.save_score(score)
 
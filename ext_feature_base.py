@@ -30,8 +30,36 @@
 import numpy as np
 
 from sound_shift_fft import SoundShiftFFT
+from spectrum_cache import SpectrumCache
+from delay_model import DelayModel
 from soundmap.wave_data import WaveData
 
+#==========================================================================
+# moving average along frames (axis -2) of features
+#   features: frames x bins matrix or vehicles x frames x bins tensor
+#   same as np.convolve(..., mode='valid') with a flat window for each column,
+#   calculated for all columns at once by cumulative sum (accumulated in double)
+#   fewer frames than winsize result in no frames, as block_average does
+def moving_average(features, winsize):
+    if features.shape[-2] < winsize:
+        return np.empty(features.shape[:-2] + (0, features.shape[-1]), dtype=features.dtype)
+    acc_dtype = np.complex128 if np.iscomplexobj(features) else np.float64
+    csum = np.cumsum(features, axis=-2, dtype=acc_dtype)
+    ret = np.empty(csum.shape[:-2] + (csum.shape[-2]-winsize+1, csum.shape[-1]), dtype=acc_dtype)
+    ret[...,0,:] = csum[...,winsize-1,:]
+    np.subtract(csum[...,winsize:,:], csum[...,:-winsize,:], out=ret[...,1:,:])
+    ret /= winsize
+    return ret.astype(features.dtype, copy=False)
+
+#--------------------------------------------------------------------------
+# average of each block of winsize frames (axis -2) of features
+#   the last frames not filling a block are discarded
+def block_average(features, winsize):
+    blocks = features.shape[-2] // winsize
+    features = features[...,:blocks*winsize,:]
+    return np.mean(features.reshape(features.shape[:-2] + (blocks, winsize, features.shape[-1])),
+                   axis=-2)
+
 #==========================================================================
 class ExtFeatureBase():
     def __init__(self,
@@ -43,6 +71,19 @@ class ExtFeatureBase():
                  ma_overlap=True, # flag if moving average windows overlap
                  D=0.5,           # mic separation
                  L=2.0,           # distance between road the mic
+                 fft_mem_limit=None, # memory budget for chunked FFT in bytes
+                 fft_mmap_dir=None,  # directory to store FFT results as memmap
+                 fft_lazy=False,     # calculate FFT only around vehicles on demand
+                 fft_cache_dir=None,    # directory for FFT results cache shared among runs
+                 fft_cache_size=None,   # maximum size of FFT results cache in bytes
+                 fft_cache_cutoff=None, # highest frequency stored in cache (None: all)
+                 precision='double',    # 'double' or 'single' precision for FFT and features
+                 fft_backend='numpy',   # FFT backend ('numpy', 'scipy', 'pyfftw' or 'auto')
+                 fft_workers=None,      # number of threads for FFT (None: all cores)
+                 fft_wisdom=None,       # FFTW wisdom file for pyfftw backend
+                 delay_mem_limit=None,  # memory budget for delay curves of many vehicles in bytes
+                 delay_v_step=None,     # velocity step for cached delay curves (None: exact)
+                 delay_cache_size=1024, # maximum number of cached delay curves
                  ):
         self.win        = win
         self.cutoff     = cutoff
@@ -52,32 +93,122 @@ class ExtFeatureBase():
         self.ma_overlap = ma_overlap
         self.D          = D
         self.L          = L
+        self.fft_mem_limit = fft_mem_limit
+        self.fft_mmap_dir  = fft_mmap_dir
+        self.fft_lazy      = fft_lazy
+        self.fft_cache_dir    = fft_cache_dir
+        self.fft_cache_size   = fft_cache_size
+        self.fft_cache_cutoff = fft_cache_cutoff
+        self.precision        = precision
+        self.fft_backend      = fft_backend
+        self.fft_workers      = fft_workers
+        self.fft_wisdom       = fft_wisdom
 
+        self.wavfile = None          # loaded wav file
         self.c     = 340.0           # sound speed in air
         self.model = self.model_func # soundmap model function
+        # S-curve delay engine for many vehicles
+        self.delay = DelayModel(self.D, self.L, self.c,
+                                mem_limit  = delay_mem_limit,
+                                v_step     = delay_v_step,
+                                cache_size = delay_cache_size,
+                                )
         return
 
     #----------------------------------------------------------------------
     def load_sound(self, wavfile):
         # load wav file
+        self.wavfile = wavfile
         wav = WaveData(wavfile, decimate=False)
 
-        # FFT
+        # FFT (only freq bins below cutoff are kept)
         self.sig = SoundShiftFFT(np.array(wav.left),
                                  np.array(wav.right),
                                  wav.sample_rate,
                                  self.fft_len,
                                  self.fft_shift,
+                                 mem_limit = self.fft_mem_limit,
+                                 mmap_dir  = self.fft_mmap_dir,
+                                 precision = self.precision,
+                                 fft_backend = self.fft_backend,
+                                 fft_workers = self.fft_workers,
+                                 fft_wisdom  = self.fft_wisdom,
+                                 max_bin     = self.max_bin(wav.sample_rate),
                                  )
-        self.sig.fft_all()
         del wav
 
+        cache = None
+        if self.fft_cache_dir is not None:
+            cache = SpectrumCache(self.fft_cache_dir, self.fft_cache_size)
+            # store only freq bins up to fft_cache_cutoff if it covers cutoff
+            n_bins = None
+            if self.fft_cache_cutoff is not None and self.cutoff is not None \
+               and self.cutoff <= self.fft_cache_cutoff:
+                n_bins = self.cutoff_len(self.fft_cache_cutoff) + 1
+
+        if cache is not None and cache.load(wavfile, self.sig):
+            print("FFT results loaded from cache")
+        elif self.fft_lazy:
+            self.sig.fft_lazy()
+        elif cache is not None:
+            cache.store(wavfile, self.sig, n_bins)
+        else:
+            self.sig.fft_all()
+
+        self.set_signal(self.sig)
+        return
+
+    #----------------------------------------------------------------------
+    # use FFT results in SpectrumBank
+    #   resolution is selected by name (default: fft_len and fft_shift of this instance)
+    def use_bank(self, bank, name=None):
+        if name is None:
+            name = bank.name(self.fft_len, self.fft_shift)
+        self.wavfile = bank.wavfile
+        self.set_signal(bank.get(name))
+        return
+
+    #----------------------------------------------------------------------
+    # use FFT results in sig (SoundShiftFFT compatible instance)
+    def set_signal(self, sig):
+        self.sig = sig
         # FFT sampling interval
         self.samp_int = self.sig.shift / self.sig.samp_rate
         # window size in FFT samples
         self.winlen = int(self.win / self.samp_int)
         return
 
+    #----------------------------------------------------------------------
+    # parameters that determine features of a vehicle in a recording
+    def feature_params(self):
+        return {'ext_feature_class': type(self).__module__ + "." + type(self).__name__,
+                'winsize':      self.win,
+                'cutoff':       self.cutoff,
+                'fft_len':      self.fft_len,
+                'fft_shift':    self.fft_shift,
+                'ma_len':       self.ma_len,
+                'ma_overlap':   self.ma_overlap,
+                'D':            self.D,
+                'L':            self.L,
+                'precision':    self.precision,
+                # backend selected for the loaded signal ('auto' is resolved)
+                'fft_backend':  self.sig.fft.name if getattr(self, 'sig', None) is not None
+                                else self.fft_backend,
+                'delay_v_step': self.delay.v_step,
+                }
+
+    #----------------------------------------------------------------------
+    # number of freq bins below cutoff frequency (excluding DC)
+    def cutoff_len(self, cutoff):
+        return int(np.round(self.sig.winsize * cutoff / self.sig.samp_rate))
+
+    #----------------------------------------------------------------------
+    # highest freq bin used in features (None: all)
+    def max_bin(self, samp_rate):
+        if self.cutoff is None:
+            return None
+        return int(np.round(self.fft_len * self.cutoff / samp_rate))
+
     #----------------------------------------------------------------------
     # default S-curve model
     def model_func(self, t, param):
@@ -87,11 +218,40 @@ class ExtFeatureBase():
             return ( np.sqrt( (v*(t-t0) + self.D/2)**2 + self.L**2 )
                         - np.sqrt( (v*(t-t0) - self.D/2)**2 + self.L**2 ) ) / self.c
 
-        v  = param[:,0]
-        t0 = param[:,1]
-        vt = (np.tile(t, [len(v), 1]) - np.tile(t0, [len(t), 1]).T) * np.tile(v, [len(t), 1]).T
-        return ( np.sqrt((vt+self.D/2)**2 + self.L**2)
-                - np.sqrt((vt-self.D/2)**2 + self.L**2) ) / self.c
+        # len(param) x len(t) matrix by broadcasting (in chunks if delay_mem_limit is set)
+        return self.delay(t, param[:,0], param[:,1])
+
+    #----------------------------------------------------------------------
+    # S-curve model for N vehicles with their own time vectors
+    #   t: N x len matrix, v and t0: N elements
+    #   each row is identical to model_func(t[i], np.array([v[i], t0[i]]))
+    def model_delays(self, t, v, t0):
+        return self.delay(t, v, t0)
+
+    #----------------------------------------------------------------------
+    # sound delays in the windows of N vehicles (N x winlen)
+    #   time_idx and t0_offset are the ones returned by window_indices
+    #   if delay_v_step is set, curves of quantized velocities are shared
+    #   among vehicles instead of exact model_delays
+    def window_delays(self, time_idx, t0_offset, v):
+        if self.delay.v_step is None:
+            return self.model_delays(time_idx*self.samp_int, v, t0_offset*self.samp_int)
+        return self.delay.lookup(self.window_time(), v)
+
+    #----------------------------------------------------------------------
+    # sound delays of a vehicle at time_idx (the ones returned by time_indices)
+    #   the same curves as window_delays are used if delay_v_step is set,
+    #   so features of a vehicle and of N vehicles at once are the same
+    def vehicle_delays(self, time_idx, t0_offset, v):
+        if self.delay.v_step is None:
+            return self.model(time_idx*self.samp_int, np.array([v, t0_offset*self.samp_int]))
+        curve = self.delay.lookup(self.window_time(), v)[0]
+        return curve[time_idx - t0_offset + int(self.winlen/2)]
+
+    #----------------------------------------------------------------------
+    # time from t0 in the window of a vehicle
+    def window_time(self):
+        return np.arange(-int(self.winlen/2), int(self.winlen/2)) * self.samp_int
 
     #----------------------------------------------------------------------
     def time_indices(self, t0, v):
@@ -108,6 +268,27 @@ class ExtFeatureBase():
 
         return (time_idx, t0_offset)
 
+    #----------------------------------------------------------------------
+    # time indices of the windows of N vehicles
+    #   returns (N x winlen matrix of time indices, t0 offsets)
+    #   indices out of the recording are not trimmed
+    def window_indices(self, t0):
+        t0_offset = np.round(np.asarray(t0, dtype=np.float64) / self.samp_int).astype(np.int64)
+        time_idx = t0_offset[:,np.newaxis] + np.arange(-int(self.winlen/2), int(self.winlen/2))
+        return (time_idx, t0_offset)
+
+    #----------------------------------------------------------------------
+    # calculate FFT at once for the windows of all vehicles
+    #   effective only if FFT is lazily calculated
+    def prefetch(self, t0):
+        time_idx, t0_offset = self.window_indices(t0)
+
+        time_idx = time_idx.reshape(-1)
+        time_idx = time_idx[(time_idx >= 0) & (time_idx < self.sig.fft_data1.shape[0])]
+
+        self.sig.prefetch(time_idx)
+        return
+
     #----------------------------------------------------------------------
     def feature(self, t0, v, winsize=None, slide=None):
         if winsize is None:
@@ -119,32 +300,16 @@ class ExtFeatureBase():
         features = self.extract_feature(t0, v)
 
         # limit frequency range (also exclude DC)
-        if self.cutoff is not None:
-            cutoff_len = int(np.round(self.sig.winsize * self.cutoff / self.sig.samp_rate))
-            features = features[:,1:cutoff_len+1]
-        else:
-            features = features[:,1:]
+        features = self.limit_bins(features)
 
         # sliding window?
         if slide:
-            # matrix for storing results
-            ret = np.empty([features.shape[0]-winsize+1, features.shape[1]],
-                           dtype=np.complex)
-            # moving average window
-            ma_win = np.ones(winsize) / winsize
-            # moving average for each column (freq) of features
-            for i in range(features.shape[1]):
-                ret[:,i] = np.convolve(np.real(features[:,i]), ma_win, mode='valid') \
-                  + np.convolve(np.imag(features[:,i]), ma_win, mode='valid')*1j
+            # moving average for all columns (freq) of features
+            ret = moving_average(features, winsize)
         else:
             # divide each freq component in winsize and average
             # cut the last part of residuals
-            cut = features.shape[0] % winsize
-            if cut != 0:
-                features = features[0:-cut,:]
-            # average the each divided data
-            ret = np.mean(features.reshape(-1,winsize,features.shape[1]),
-                          axis=1)
+            ret = block_average(features, winsize)
 
         # split amplitude and phase
         #   phase is more divided into sin/cos to consider phase rotation
@@ -152,10 +317,72 @@ class ExtFeatureBase():
         # phase = np.exp(np.angle(ret)*1j)
         return amp
 
+    #----------------------------------------------------------------------
+    # features of N vehicles at once
+    #   returns (N x rows x bins array, N x rows mask of valid rows)
+    #   a row is valid only if all frames averaged in it are in the recording,
+    #   so the valid rows of a vehicle near the edges are the rows feature() returns
+    #   (with ma_overlap; blocks are aligned to the untrimmed window otherwise)
+    def features(self, t0, v, winsize=None, slide=None):
+        if winsize is None:
+            winsize = self.ma_len
+        if slide is None:
+            slide = self.ma_overlap
+
+        # derive feature tensor
+        features, mask = self.extract_features(t0, v)
+
+        # limit frequency range (also exclude DC)
+        features = self.limit_bins(features)
+
+        # sliding window?
+        if slide:
+            ret = moving_average(features, winsize)
+            # number of valid frames in each moving average window
+            count = np.cumsum(np.c_[np.zeros([len(mask), 1], dtype=np.int64), mask], axis=1)
+            mask = (count[:,winsize:] - count[:,:-winsize]) == winsize
+        else:
+            ret = block_average(features, winsize)
+            blocks = ret.shape[-2]
+            mask = mask[:,:blocks*winsize].reshape(len(mask), blocks, winsize).all(axis=2)
+
+        return np.abs(ret), mask
+
+    #----------------------------------------------------------------------
+    # limit frequency range of features (also exclude DC)
+    #   column i of features is freq bin i+bin_lo
+    def limit_bins(self, features):
+        bin_lo = self.sig.bin_lo
+        if self.cutoff is not None:
+            cutoff_len = self.cutoff_len(self.cutoff)
+            return features[...,1-bin_lo:cutoff_len+1-bin_lo]
+        return features[...,1-bin_lo:]
+
     #----------------------------------------------------------------------
     def extract_feature(self, t0, v):
         return np.empty([self.winlen, self.win])
 
+    #----------------------------------------------------------------------
+    # extract features of N vehicles at once
+    #   returns (N x winlen x bins array, N x winlen mask of frames in the recording)
+    #   frames out of the recording are filled with 0
+    #   this default implementation calls extract_feature for each vehicle
+    def extract_features(self, t0, v):
+        t0 = np.asarray(t0)
+        v  = np.asarray(v)
+        time_idx, t0_offset = self.window_indices(t0)
+        ret  = None
+        mask = np.zeros(time_idx.shape, dtype=bool)
+        for i in range(len(t0_offset)):
+            idx, offset = self.time_indices(t0[i], v[i])
+            fet = self.extract_feature(t0[i], v[i])
+            if ret is None:
+                ret = np.zeros(time_idx.shape + fet.shape[1:], dtype=fet.dtype)
+            pos = idx - time_idx[i,0]
+            ret[i,pos] = fet
+            mask[i,pos] = True
+        return ret, mask
+
 #==========================================================================
 if __name__ == '__main__':
     pass
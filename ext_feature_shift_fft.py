@@ -40,13 +40,23 @@ class ExtFeature(ExtFeatureBase):
     def extract_feature(self, t0, v):
         time_idx, t0_offset = self.time_indices(t0, v)
         # calculate sound delay at each time index
-        sound_delay = self.model(time_idx*self.samp_int, np.array([v, t0_offset*self.samp_int]))
+        sound_delay = self.vehicle_delays(time_idx, t0_offset, v)
 
         # shift back back left channel and merge in freq domain
         fft_merged = self.sig.shift_merge_fft(-sound_delay, time_idx[0])
 
         return fft_merged
 
+    #----------------------------------------------------------------------
+    # feature extraction for N vehicles at once
+    def extract_features(self, t0, v):
+        time_idx, t0_offset = self.window_indices(t0)
+        # calculate sound delay at each time index of each vehicle
+        sound_delay = self.window_delays(time_idx, t0_offset, v)
+
+        # shift back back left channel and merge in freq domain
+        return self.sig.shift_merge_fft_batch(-sound_delay, time_idx[:,0])
+
 #==========================================================================
 if __name__ == '__main__':
     pass
@@ -42,6 +42,17 @@ class ExtFeature(ExtFeatureBase):
 
         return np.array(self.sig.fft_data1[time_idx])
 
+    #----------------------------------------------------------------------
+    # feature extraction for N vehicles at once
+    def extract_features(self, t0, v):
+        time_idx, t0_offset = self.window_indices(t0)
+        mask = (time_idx >= 0) & (time_idx < self.sig.fft_data1.shape[0])
+
+        ret = np.array(self.sig.fft_data1[np.clip(time_idx, 0, self.sig.fft_data1.shape[0] - 1)])
+        ret[~mask] = 0
+
+        return ret, mask
+
 #==========================================================================
 if __name__ == '__main__':
     pass
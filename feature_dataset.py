@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+
+import os
+import struct
+import numpy as np
+
+#==========================================================================
+# features of vehicles with their labels and ids
+#   features:      rows x bins contiguous array
+#   labels:        vehicle type id of each row (int8 or int16)
+#   vehicle_ids:   vehicle id (row index in Vehicles.data) of each row
+#   recording_ids: recording id of each row
+#   frames:        offset of each row in the feature rows of the vehicle
+#   each field is saved in <base>_<field>.npy and can be loaded as memmap
+class FeatureDataset():
+    fields = ['features', 'labels', 'vehicle_ids', 'recording_ids', 'frames']
+
+    def __init__(self, features, labels, vehicle_ids=None, recording_ids=None, frames=None):
+        if not isinstance(features, np.memmap):
+            features = np.ascontiguousarray(features)
+        self.features = features
+        self.labels   = labels
+        if vehicle_ids is None:
+            vehicle_ids = np.zeros(len(labels), dtype=np.int64)
+        if recording_ids is None:
+            recording_ids = np.zeros(len(labels), dtype=np.int64)
+        if frames is None:
+            frames = np.zeros(len(labels), dtype=np.int64)
+        self.vehicle_ids   = vehicle_ids
+        self.recording_ids = recording_ids
+        self.frames        = frames
+        return
+
+    #----------------------------------------------------------------------
+    # smallest integer type for labels 0..classes-1
+    @staticmethod
+    def label_dtype(classes):
+        return np.int8 if classes <= np.iinfo(np.int8).max + 1 else np.int16
+
+    #----------------------------------------------------------------------
+    def __len__(self):
+        return len(self.labels)
+
+    #----------------------------------------------------------------------
+    # (recording id, vehicle id) of each row
+    @property
+    def row_ids(self):
+        return np.c_[self.recording_ids, self.vehicle_ids]
+
+    #----------------------------------------------------------------------
+    # feature matrix with labels in the last column (format of Vehicles.calc_features)
+    def matrix(self):
+        ret = np.empty([len(self), self.features.shape[1]+1], dtype=self.features.dtype)
+        ret[:,:-1] = self.features
+        ret[:,-1]  = self.labels
+        return ret
+
+    #----------------------------------------------------------------------
+    def save(self, base):
+        for field in self.fields:
+            np.save("%s_%s.npy" % (base, field), getattr(self, field))
+        return
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def load(cls, base, mmap_mode='r'):
+        return cls(*[np.load("%s_%s.npy" % (base, field), mmap_mode=mmap_mode)
+                     for field in cls.fields])
+
+    #----------------------------------------------------------------------
+    # empty memory-mapped dataset in <base>_<field>.npy files
+    @classmethod
+    def create(cls, base, rows, columns, dtype, label_dtype):
+        dtypes = [dtype, label_dtype, np.int64, np.int64, np.int64]
+        shapes = [(rows, columns), (rows,), (rows,), (rows,), (rows,)]
+        return cls(*[np.lib.format.open_memmap("%s_%s.npy" % (base, field), mode='w+',
+                                               dtype=dt, shape=shape)
+                     for field, dt, shape in zip(cls.fields, dtypes, shapes)])
+
+    #----------------------------------------------------------------------
+    def flush(self):
+        for field in self.fields:
+            value = getattr(self, field)
+            if isinstance(value, np.memmap):
+                value.flush()
+        return
+
+#==========================================================================
+# FeatureDataset written into <base>_<field>.npy files by appending rows
+#   the number of rows is not needed in advance:
+#   npy headers of fixed length are written again with the number of rows at close
+class FeatureDatasetWriter():
+    header_len = 128
+
+    def __init__(self, base, columns, dtype, label_dtype):
+        self.base    = base
+        self.columns = columns
+        self.dtypes  = [np.dtype(dt) for dt in [dtype, label_dtype, np.int64, np.int64, np.int64]]
+        self.rows    = 0
+        self.files   = []
+        for field, dt in zip(FeatureDataset.fields, self.dtypes):
+            self.files.append(open("%s_%s.npy" % (base, field), "wb"))
+            self.files[-1].write(self.header(dt, self.shape(field)))
+        return
+
+    #----------------------------------------------------------------------
+    # npy header of header_len bytes (format version 1.0)
+    @classmethod
+    def header(cls, dtype, shape):
+        magic = np.lib.format.magic(1, 0)
+        d = repr({'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': shape})
+        size = cls.header_len - len(magic) - 2
+        return magic + struct.pack("<H", size) + d.ljust(size - 1).encode('latin1') + b"\n"
+
+    #----------------------------------------------------------------------
+    def shape(self, field):
+        return (self.rows, self.columns) if field == 'features' else (self.rows,)
+
+    #----------------------------------------------------------------------
+    # append all rows of FeatureDataset ds
+    def append(self, ds):
+        for field, f, dt in zip(FeatureDataset.fields, self.files, self.dtypes):
+            np.ascontiguousarray(getattr(ds, field), dtype=dt).tofile(f)
+        self.rows += len(ds)
+        return
+
+    #----------------------------------------------------------------------
+    # write headers with the number of rows and close files
+    def close(self):
+        for field, f, dt in zip(FeatureDataset.fields, self.files, self.dtypes):
+            f.seek(0)
+            f.write(self.header(dt, self.shape(field)))
+            f.close()
+        return
+
+    #----------------------------------------------------------------------
+    # close and remove files (of incomplete dataset)
+    def remove(self):
+        for field, f in zip(FeatureDataset.fields, self.files):
+            f.close()
+            os.remove("%s_%s.npy" % (self.base, field))
+        return
+
+#==========================================================================
+if __name__ == '__main__':
+    pass
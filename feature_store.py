@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+
+import os
+import glob
+import json
+import time
+import hashlib
+import tempfile
+import numpy as np
+
+from spectrum_cache import file_hash
+
+#==========================================================================
+# on-disk store of per-vehicle features
+#   features depend on the recording, the vehicle (t0 and v) and the parameters
+#   of the feature extractor (ExtFeatureBase.feature_params)
+#   each entry is a set of .npy files loaded as memmap
+#     <wav hash>_<params hash>_<id>_keys.npy:     N x 2 (t0, v) of vehicles
+#     <wav hash>_<params hash>_<id>_features.npy: N x rows x bins features
+#     <wav hash>_<params hash>_<id>_mask.npy:     N x rows validity mask
+#   new vehicles of a recording are appended as a new entry
+class FeatureStore():
+    parts = ["features", "mask", "keys"]
+
+    def __init__(self,
+                 store_dir,     # store directory
+                 max_size=None, # maximum total size of store in bytes (None: unlimited)
+                 ):
+        self.store_dir = store_dir
+        self.max_size  = max_size
+        self.memo_file = os.path.join(store_dir, "hashes.json")
+
+        if not os.path.exists(self.store_dir):
+            os.makedirs(self.store_dir, exist_ok=True)
+
+        return
+
+    #----------------------------------------------------------------------
+    # hash of feature extractor parameters
+    @staticmethod
+    def params_hash(ext):
+        params = json.dumps(ext.feature_params(), sort_keys=True)
+        return hashlib.sha1(params.encode()).hexdigest()[:16]
+
+    #----------------------------------------------------------------------
+    def group_base(self, wavfile, ext):
+        return os.path.join(self.store_dir, "%s_%s" % (file_hash(wavfile, self.memo_file),
+                                                       self.params_hash(ext)))
+
+    #----------------------------------------------------------------------
+    # complete entries of the group (keys file is written last)
+    def entries(self, group):
+        return sorted([f[:-len("_keys.npy")] for f in glob.glob(group + "_*_keys.npy")])
+
+    #----------------------------------------------------------------------
+    # load stored features of vehicles (t0, v)
+    #   returns (found, features, mask)
+    #     found: N elements flag of vehicles found in store
+    #     features and mask: N x rows x bins and N x rows arrays
+    #       (rows of vehicles not found are not initialized, None if nothing found)
+    def load(self, wavfile, ext, t0, v):
+        t0 = np.asarray(t0, dtype=np.float64)
+        v  = np.asarray(v, dtype=np.float64)
+        found = np.zeros(len(t0), dtype=bool)
+        features = mask = None
+
+        # position of each vehicle
+        index = dict(zip(zip(t0.tolist(), v.tolist()), range(len(t0))))
+
+        for entry in self.entries(self.group_base(wavfile, ext)):
+            try:
+                keys = np.load(entry + "_keys.npy")
+                fet  = np.load(entry + "_features.npy", mmap_mode='r')
+                msk  = np.load(entry + "_mask.npy", mmap_mode='r')
+            except (IOError, ValueError):
+                # removed by other processes or broken
+                continue
+
+            rows = []
+            pos  = []
+            for row, key in enumerate(map(tuple, keys.tolist())):
+                i = index.get(key)
+                if i is not None and not found[i]:
+                    rows.append(row)
+                    pos.append(i)
+            if len(rows) == 0:
+                continue
+
+            if features is None:
+                features = np.empty((len(t0),) + fet.shape[1:], dtype=fet.dtype)
+                mask     = np.empty((len(t0),) + msk.shape[1:], dtype=bool)
+            features[pos] = fet[rows]
+            mask[pos]     = msk[rows]
+            found[pos]    = True
+
+            # update last access time for LRU eviction
+            self.touch(entry)
+
+        return found, features, mask
+
+    #----------------------------------------------------------------------
+    # append features of vehicles (t0, v) as a new entry
+    def store(self, wavfile, ext, t0, v, features, mask):
+        if len(t0) == 0:
+            return
+        entry = "%s_%x%05d" % (self.group_base(wavfile, ext), time.time_ns(), os.getpid() % 100000)
+        arrays = {"features": features,
+                  "mask":     mask,
+                  "keys":     np.c_[np.asarray(t0, dtype=np.float64), np.asarray(v, dtype=np.float64)],
+                  }
+
+        # write in temporary files and rename to avoid exposing incomplete entries
+        tmpfiles = {}
+        try:
+            for part in self.parts:
+                fd, tmpfile = tempfile.mkstemp(suffix=".npy.tmp", dir=self.store_dir)
+                os.close(fd)
+                tmpfiles[part] = tmpfile
+                with open(tmpfile, 'wb') as f:
+                    np.save(f, arrays[part])
+            for part in self.parts:
+                os.replace(tmpfiles[part], "%s_%s.npy" % (entry, part))
+        except BaseException:
+            for f in tmpfiles.values():
+                if os.path.exists(f):
+                    os.remove(f)
+            raise
+
+        self.evict(keep=entry)
+
+        return
+
+    #----------------------------------------------------------------------
+    def touch(self, entry):
+        for part in self.parts:
+            try:
+                os.utime("%s_%s.npy" % (entry, part))
+            except OSError:
+                pass
+        return
+
+    #----------------------------------------------------------------------
+    # remove least recently used entries until store size gets within max_size
+    def evict(self, keep=None):
+        if self.max_size is None:
+            return
+
+        entries = {}
+        for part in self.parts:
+            for f in glob.glob(os.path.join(self.store_dir, "*_%s.npy" % part)):
+                entry = f[:-len("_%s.npy" % part)]
+                try:
+                    stat = os.stat(f)
+                except OSError:
+                    continue
+                size, last = entries.get(entry, (0, 0))
+                entries[entry] = (size + stat.st_size, max(last, stat.st_mtime))
+
+        total = sum([size for size, last in entries.values()])
+        for entry in sorted(entries.keys(), key=lambda x: entries[x][1]):
+            if total <= self.max_size:
+                break
+            if entry == keep:
+                continue
+            # keys first not to leave an entry that looks complete
+            for part in reversed(self.parts):
+                try:
+                    os.remove("%s_%s.npy" % (entry, part))
+                except OSError:
+                    pass
+            total -= entries[entry][0]
+
+        return
+
+#==========================================================================
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+
+import os
+import time
+import atexit
+import importlib.util
+import numpy as np
+
+#==========================================================================
+# FFTの計算方法を切り替えるためのクラス群
+#   rfft(x)はxの最後の軸 (各行) をFFTする
+class NumpyFFT():
+    name = 'numpy'
+    module = 'numpy'
+
+    def __init__(self, workers=None, wisdom_file=None):
+        self.workers = 1
+        return
+
+    #----------------------------------------------------------------------
+    def rfft(self, x):
+        return np.fft.rfft(x)
+
+#==========================================================================
+# scipy.fft (workers個のスレッドで並列に計算)
+class ScipyFFT():
+    name = 'scipy'
+    module = 'scipy'
+
+    def __init__(self, workers=None, wisdom_file=None):
+        import scipy.fft
+        self.fft = scipy.fft
+        self.workers = workers if workers is not None else os.cpu_count()
+        return
+
+    #----------------------------------------------------------------------
+    def rfft(self, x):
+        return self.fft.rfft(x, workers=self.workers)
+
+#==========================================================================
+# pyFFTW (FFTWのplanをキャッシュし，wisdomをファイルに保存して次回以降も使う)
+#   FFTする行数はLazySpectrumのblockやchunkの端数，streamのpushごとに変わるので，
+#   新しい行数ごとのplan作成が軽いFFTW_ESTIMATEをデフォルトとする
+#   wisdomは終了時 (またはsave_wisdom()の呼び出し時) にまとめて保存する
+class PyFFTW():
+    name = 'pyfftw'
+    module = 'pyfftw'
+
+    def __init__(self, workers=None, wisdom_file=None, planner_effort='FFTW_ESTIMATE'):
+        import pyfftw
+        import pyfftw.interfaces.numpy_fft
+        self.pyfftw = pyfftw
+        self.fft = pyfftw.interfaces.numpy_fft
+        self.workers = workers if workers is not None else os.cpu_count()
+        self.wisdom_file = wisdom_file
+        self.planner_effort = planner_effort
+
+        # FFTW objectを再利用
+        pyfftw.interfaces.cache.enable()
+        pyfftw.interfaces.cache.set_keepalive_time(60)
+        self.load_wisdom()
+        if self.wisdom_file is not None:
+            wisdom_files.add(self.wisdom_file)
+
+        return
+
+    #----------------------------------------------------------------------
+    def load_wisdom(self):
+        if self.wisdom_file is None or not os.path.exists(self.wisdom_file):
+            return False
+        import pickle
+        with open(self.wisdom_file, 'rb') as f:
+            self.pyfftw.import_wisdom(pickle.load(f))
+        return True
+
+    #----------------------------------------------------------------------
+    def save_wisdom(self):
+        if self.wisdom_file is None:
+            return False
+        return save_wisdom(self.wisdom_file)
+
+    #----------------------------------------------------------------------
+    def rfft(self, x):
+        return self.fft.rfft(x, threads=self.workers, planner_effort=self.planner_effort)
+
+#----------------------------------------------------------------------
+# pyFFTWのwisdomをファイルに保存
+def save_wisdom(wisdom_file):
+    import pickle
+    import pyfftw
+    with open(wisdom_file, 'wb') as f:
+        pickle.dump(pyfftw.export_wisdom(), f)
+    return True
+
+#----------------------------------------------------------------------
+# PyFFTWで使ったwisdomファイル (終了時にまとめて保存)
+wisdom_files = set()
+
+@atexit.register
+def save_wisdom_files():
+    for wisdom_file in wisdom_files:
+        save_wisdom(wisdom_file)
+    return
+
+#--------------------------------------------------------------------------
+BACKENDS = [NumpyFFT, ScipyFFT, PyFFTW]
+
+# 'auto'で選ばれたbackend ((winsize, dtype, workers)ごと)
+auto_selected = {}
+
+#==========================================================================
+# 使用可能なbackendのクラスのリスト
+#   moduleがimportできるかのみを調べる (instanceは作らない)
+def available_backends():
+    return [backend for backend in BACKENDS
+            if importlib.util.find_spec(backend.module) is not None]
+
+#----------------------------------------------------------------------
+# 各backendでframes行前後 x winsize点のFFTにかかる時間 [s] を計測
+#   実際の使用と同じく毎回異なる行数をFFTするので，新しい行数ごとのplan作成も含む
+def benchmark(winsize, dtype=np.float64, workers=None, frames=512, repeats=3, backends=None):
+    if backends is None:
+        backends = available_backends()
+
+    x = np.random.RandomState(0).randn(frames, winsize).astype(dtype)
+    ret = {}
+    for backend in backends:
+        fft = backend(workers)
+        elapsed = []
+        for i in range(repeats):
+            start = time.perf_counter()
+            for rows in range(frames - 4*i, frames - 4*i - 4, -1):
+                fft.rfft(x[:rows])
+            elapsed.append(time.perf_counter() - start)
+        ret[backend.name] = min(elapsed)
+    return ret
+
+#----------------------------------------------------------------------
+# 名前を指定してbackendのインスタンスを作成
+#   'auto'の場合は最初に使うときに計測して最も速いものを選ぶ
+def get_backend(name='numpy', winsize=512, dtype=np.float64, workers=None, wisdom_file=None):
+    if name == 'auto':
+        key = (winsize, np.dtype(dtype).name, workers)
+        if key not in auto_selected:
+            elapsed = benchmark(winsize, dtype, workers)
+            auto_selected[key] = min(elapsed, key=elapsed.get)
+        name = auto_selected[key]
+
+    for backend in BACKENDS:
+        if backend.name == name:
+            return backend(workers, wisdom_file)
+
+    raise ValueError("unknown FFT backend '%s'" % name)
+
+#==========================================================================
+if __name__ == '__main__':
+    for backend in available_backends():
+        print(backend.name)
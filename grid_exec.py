@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+
+import os
+import shutil
+import datetime
+
+import main
+from spectrum_bank import SpectrumBank
+
+#==========================================================================
+# パラメータ情報ファイルに記載された設定ファイルを1プロセスで順に実行
+#   同じwavファイルの設定はSpectrumBankで全解像度のFFT結果を共有する
+class GridExec():
+    def __init__(self, param_file):
+        self.param_file = param_file
+
+        # (番号, 設定ファイル) のリスト
+        self.confs = []
+        with open(param_file) as f:
+            for line in f:
+                if line.startswith("#"):
+                    continue
+                cols = line.rstrip("\n").split("\t")
+                self.confs.append((int(cols[0]), cols[1]))
+
+        return
+
+    #----------------------------------------------------------------------
+    # wavファイルと演算精度ごとに設定ファイルをまとめる
+    def group_by_sound(self):
+        groups = {}
+        for cnt, conffile in self.confs:
+            config = main.load_class(conffile)
+            key = (config.wavfile, getattr(config, 'precision', 'double'))
+            if key not in groups:
+                groups[key] = {'configs': [], 'resolutions': set(),
+                               'mem_limit': getattr(config, 'fft_mem_limit', None),
+                               'mmap_dir':  getattr(config, 'fft_mmap_dir', None),
+                               'fft_backend': getattr(config, 'fft_backend', 'numpy'),
+                               'fft_workers': getattr(config, 'fft_workers', None),
+                               'fft_wisdom':  getattr(config, 'fft_wisdom', None),
+                               'cutoffs':     [],
+                               }
+            groups[key]['configs'].append((cnt, conffile))
+            groups[key]['cutoffs'].append(config.cutoff)
+            groups[key]['resolutions'].add((config.fft_len, config.fft_shift))
+        return groups
+
+    #----------------------------------------------------------------------
+    def exec_grid(self, now):
+        # 1つ目のconfigに書かれている出力先にパラメータ情報ファイルをコピー
+        config = main.load_class(self.confs[0][1])
+        if not os.path.exists(config.outdir):
+            os.makedirs(config.outdir)
+        shutil.copy(self.param_file,
+                    "%s/%s_%s" % (config.outdir, now, os.path.basename(self.param_file)))
+
+        max_cnt = self.confs[-1][0]
+        for (wavfile, precision), group in self.group_by_sound().items():
+            # 全設定で使う周波数binのみ保持
+            cutoff = None
+            if None not in group['cutoffs']:
+                cutoff = max(group['cutoffs'])
+            # 全解像度のFFT
+            print("load sound data %s" % wavfile)
+            bank = SpectrumBank(group['resolutions'],
+                                precision = precision,
+                                mem_limit = group['mem_limit'],
+                                mmap_dir  = group['mmap_dir'],
+                                fft_backend = group['fft_backend'],
+                                fft_workers = group['fft_workers'],
+                                fft_wisdom  = group['fft_wisdom'],
+                                cutoff      = cutoff,
+                                )
+            bank.load_sound(wavfile)
+
+            for cnt, conffile in group['configs']:
+                print("--------------------------------------------------")
+                print("grid: %d/%d" % (cnt, max_cnt))
+                print(datetime.datetime.today())
+                main.run(conffile, "%s_%d" % (now, cnt), bank)
+
+            del bank
+
+        return
+
+#==========================================================================
+# 引数処理
+def arg_parser():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument("param_file", type=str, action="store",
+                    help="parameter combinations info file generated by grid_config.py",
+                    )
+    return ap
+
+#==========================================================================
+if __name__ == '__main__':
+    parser = arg_parser()
+    args = parser.parse_args()
+
+    now = datetime.datetime.today().strftime("%Y%m%d_%H%M")
+
+    g = GridExec(args.param_file)
+    g.exec_grid(now)
@@ -35,6 +35,8 @@ import importlib
 import datetime
 
 import vehicles
+import dataset
+from feature_store import FeatureStore
 
 #======================================================================
 # 引数処理
@@ -62,31 +64,100 @@ def load_class(class_file):
 
     return importlib.import_module(base_file)
 
-#======================================================================
-if __name__ == '__main__':
-    parser = arg_parser()
-    args = parser.parse_args()
+#----------------------------------------------------------------------
+# 設定ファイルの内容で特徴量抽出クラスをインスタンス化
+#   kwargsで設定ファイルの値を上書きできる
+def create_ext_feature(extf_class, config, **kwargs):
+    params = dict(win        = config.winsize,
+                  cutoff     = config.cutoff,
+                  fft_len    = config.fft_len,
+                  fft_shift  = config.fft_shift,
+                  ma_len     = config.ma_len,
+                  ma_overlap = config.ma_overlap,
+                  fft_mem_limit = getattr(config, 'fft_mem_limit', None),
+                  fft_mmap_dir  = getattr(config, 'fft_mmap_dir', None),
+                  fft_lazy      = getattr(config, 'fft_lazy', False),
+                  fft_cache_dir    = getattr(config, 'fft_cache_dir', None),
+                  fft_cache_size   = getattr(config, 'fft_cache_size', None),
+                  fft_cache_cutoff = getattr(config, 'fft_cache_cutoff', None),
+                  precision        = getattr(config, 'precision', 'double'),
+                  fft_backend      = getattr(config, 'fft_backend', 'numpy'),
+                  fft_workers      = getattr(config, 'fft_workers', None),
+                  fft_wisdom       = getattr(config, 'fft_wisdom', None),
+                  delay_mem_limit  = getattr(config, 'delay_mem_limit', None),
+                  delay_v_step     = getattr(config, 'delay_v_step', None),
+                  delay_cache_size = getattr(config, 'delay_cache_size', 1024),
+                  )
+    params.update(kwargs)
+    return extf_class.ExtFeature(**params)
+
+#----------------------------------------------------------------------
+# 設定ファイルの内容で車両情報クラスをインスタンス化
+#   kwargsで設定ファイルの値を上書きできる
+def create_vehicles(config, ext, **kwargs):
+    store = None
+    if getattr(config, 'feature_store_dir', None) is not None:
+        store = FeatureStore(config.feature_store_dir, getattr(config, 'feature_store_size', None))
+    params = dict(workers  = getattr(config, 'feature_workers', None),
+                  pool     = getattr(config, 'feature_pool', 'thread'),
+                  mmap_dir = getattr(config, 'fft_mmap_dir', None),
+                  batch    = getattr(config, 'feature_batch', 4),
+                  store    = store,
+                  )
+    vehicle_info = kwargs.pop('vehicle_info', getattr(config, 'vehicle_info', None))
+    params.update(kwargs)
+    return vehicles.Vehicles(vehicle_info, ext, **params)
+
+#----------------------------------------------------------------------
+# 設定ファイルの内容で車両走行音と車両情報を読み込み
+#   bank: 読み込み済みのSpectrumBank (Noneの場合はwavファイルを読み込み)
+def load_vehicles(config, extf_class, bank=None):
+    # 特徴量抽出クラスをインスタンス化
+    ext = create_ext_feature(extf_class, config)
+    if bank is None:
+        # 車両走行音データを読み込み
+        print("load sound data %s" % config.wavfile)
+        ext.load_sound(config.wavfile)
+    else:
+        # 読み込み済みのFFT結果から該当する解像度を使う
+        ext.use_bank(bank)
+
+    # 車両情報クラスをインスタンス化
+    veh = create_vehicles(config, ext)
+    # 車両情報を読み込み
+    print("load vehicle data %s" % config.vehicle_info)
+    veh.load_data()
+
+    # # 同時・連続通過を判定
+    # veh.num_simul_successive()
+
+    # 車両情報への前処理を実施
+    if 'pre_vehicle' in list(config.__dict__.keys()):
+        config.pre_vehicle(veh)
+
+    return veh
 
+#----------------------------------------------------------------------
+# 設定ファイルconffileで推定を実行
+#   base: 出力ファイルのベース (Noneの場合は現在時刻)
+#   bank: 読み込み済みのSpectrumBank (Noneの場合はwavファイルを読み込み)
+def run(conffile, base=None, bank=None):
     # 設定ファイル読み込み
-    try:
-        config = load_class(args.conffile)
-    except ImportError:
-        sys.stderr.write('Error: Ignore missing config file "' + args.conffile + '"\n')
-        sys.exit(1)
+    config = load_class(conffile)
 
     if not os.path.exists(config.outdir):
         os.makedirs(config.outdir)
 
     # 指定がなければ現在時刻を取得して出力ファイルのベースとする
     now = datetime.datetime.today().strftime("%Y%m%d_%H%M")
-    if args.base is None:
-        args.base = now
-    save_base = config.outdir + "/" + args.base
+    if base is None:
+        base = now
+    save_base = config.outdir + "/" + base
 
-    print(args.conffile + " saved as " + save_base + "_config.py")
+    print(conffile + " saved as " + save_base + "_config.py")
 
     # 設定ファイルをコピーしておく
-    shutil.copy(args.conffile, save_base + "_config.py")
+    shutil.copy(conffile, save_base + "_config.py")
 
     #--------------------------------------------------
     # 特徴量抽出クラスを読み込み
@@ -94,30 +165,16 @@ if __name__ == '__main__':
     # 推定クラスを読み込み
     est_class  = load_class(config.est_class)
 
-    # 特徴量抽出クラスをインスタンス化
-    ext = extf_class.ExtFeature(win        = config.winsize,
-                                cutoff     = config.cutoff,
-                                fft_len    = config.fft_len,
-                                fft_shift  = config.fft_shift,
-                                ma_len     = config.ma_len,
-                                ma_overlap = config.ma_overlap,
-                                )
-    # 車両走行音データを読み込み
-    print("load sound data %s" % config.wavfile)
-    ext.load_sound(config.wavfile)
-
-    # 車両情報クラスをインスタンス化
-    veh = vehicles.Vehicles(config.vehicle_info, ext)
-    # 車両情報を読み込み
-    print("load vehicle data %s" % config.vehicle_info)
-    veh.load_data()
-
-    # # 同時・連続通過を判定
-    # veh.num_simul_successive()
-
-    # 車両情報への前処理を実施
-    if 'pre_vehicle' in list(config.__dict__.keys()):
-        config.pre_vehicle(veh)
+    if getattr(config, 'manifest', None) is not None:
+        # 複数の録音の車両情報を読み込み
+        #   特徴量は録音ごとにworkerプロセスで抽出する
+        veh = dataset.Dataset(config.manifest, conffile, save_base,
+                              workers = getattr(config, 'dataset_workers', None),
+                              )
+        print("load vehicle data in %s" % config.manifest)
+        veh.load_data()
+    else:
+        veh = load_vehicles(config, extf_class, bank)
 
     # 車両種別と車両種別IDの対応を設定ファイルに追記
     with open(save_base + "_config.py", "a") as f:
@@ -133,6 +190,8 @@ if __name__ == '__main__':
     e = est_class.Estimate(vehicles    = veh,
                            result_file = "%s_result.csv" % (save_base),
                            score_file  = "%s_score.csv" % (save_base),
+                           workers     = getattr(config, 'cv_workers', 1),
+                           **getattr(config, 'est_params', {})
                            )
 
     # 特徴量抽出
@@ -140,6 +199,8 @@ if __name__ == '__main__':
 
     # 推定
     e.validate(folds=config.folds, repeat=config.repeats)
+    # 各foldで使ったデータのindexを保存
+    e.save_splits("%s_splits.npz" % (save_base))
 
     # 最終結果をとりまとめ
     e.load_result(e.result_file)
@@ -152,3 +213,19 @@ if __name__ == '__main__':
         if type(config.plot) is str:
             plotfile = config.plot
         e.plot_confusion_matrix(plot_file=plotfile, type_ids=veh.type_ids)
+
+    return e.final_accuracy
+
+#======================================================================
+if __name__ == '__main__':
+    parser = arg_parser()
+    args = parser.parse_args()
+
+    # 設定ファイル読み込み
+    try:
+        config = load_class(args.conffile)
+    except ImportError:
+        sys.stderr.write('Error: Ignore missing config file "' + args.conffile + '"\n')
+        sys.exit(1)
+
+    run(args.conffile, args.base)
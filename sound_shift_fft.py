@@ -27,9 +27,101 @@
 # SUCH DAMAGE.
 # 
 
+import os
+import tempfile
+import threading
+import weakref
 import numpy as np
 from soundmap.signal_process import SignalProcess
 
+from fft_backend import get_backend
+
+#--------------------------------------------------------------------------
+# memmapファイルの後始末
+def remove_files(files):
+    for f in files:
+        try:
+            os.remove(f)
+        except OSError:
+            pass
+    return
+
+#--------------------------------------------------------------------------
+# 演算精度ごとの (実数, 複素数) 型
+PRECISIONS = {
+    'double': (np.float64, np.complex128),
+    'single': (np.float32, np.complex64),
+    }
+
+#--------------------------------------------------------------------------
+# 保持する周波数binの範囲 [bin_lo, bin_hi)
+#   max_binがNoneの場合はDCを含む全bin，指定した場合はDCを除く1..max_bin
+def bin_range(winsize, max_bin=None):
+    if max_bin is None:
+        return 0, winsize//2 + 1
+    return 1, min(max_bin, winsize//2) + 1
+
+#==========================================================================
+# 整数shift量mごとのphase shift exp(-j2\pi k m / N) の表
+#   table[m - m_lo] がshift量mに対するphase shift (保持している周波数binの分のみ)
+#   必要なmの範囲が広がった時のみ表を拡張する
+#   複数スレッドから同時に参照してよい
+class PhaseKernel():
+    def __init__(self, winsize, bin_lo, bins, dtype):
+        self.winsize = winsize
+        self.dtype   = np.dtype(dtype)
+        self.k = np.arange(bin_lo, bin_lo + bins, dtype=np.finfo(self.dtype).dtype)
+
+        self.m_lo  = 0
+        self.table = np.empty([0, bins], dtype=self.dtype)
+        self.lock  = threading.Lock()
+        return
+
+    #----------------------------------------------------------------------
+    # m_lo <= m < m_hi のphase shiftを計算
+    def calc(self, m_lo, m_hi):
+        m = np.arange(m_lo, m_hi, dtype=np.int64)
+        exps = (-2j*np.pi*m/self.winsize).astype(self.dtype)[:,np.newaxis] * self.k
+        return np.exp(exps)
+
+    #----------------------------------------------------------------------
+    # 表をm_lo <= m < m_hiを含むように拡張
+    def extend(self, m_lo, m_hi):
+        cur_lo = self.m_lo
+        cur_hi = self.m_lo + self.table.shape[0]
+        if self.table.shape[0] == 0:
+            cur_lo = cur_hi = m_lo
+        m_lo = min(m_lo, cur_lo)
+        m_hi = max(m_hi, cur_hi)
+        if m_lo == cur_lo and m_hi == cur_hi:
+            return
+
+        self.table = np.concatenate([self.calc(m_lo, cur_lo),
+                                     self.table,
+                                     self.calc(cur_hi, m_hi)])
+        self.m_lo = m_lo
+        return
+
+    #----------------------------------------------------------------------
+    # shift量m (整数のnp.array) に対するphase shift (m.shape + (bins,))
+    def __call__(self, m):
+        with self.lock:
+            if m.size > 0:
+                self.extend(int(m.min()), int(m.max()) + 1)
+            table, m_lo = self.table, self.m_lo
+        return table[m - m_lo]
+
+# (winsize, bin_lo, bins, dtype) ごとのPhaseKernel
+#   同じプロセス内の全車両・全実行で共有する
+phase_kernels = {}
+
+#--------------------------------------------------------------------------
+def phase_kernel(winsize, bin_lo, bins, dtype):
+    key = (winsize, bin_lo, bins, np.dtype(dtype).str)
+    if key not in phase_kernels:
+        phase_kernels[key] = PhaseKernel(winsize, bin_lo, bins, dtype)
+    return phase_kernels[key]
+
 #==========================================================================
 class SoundShiftFFT(SignalProcess):
     # winsize: FFT windowサイズ
@@ -38,6 +130,13 @@ class SoundShiftFFT(SignalProcess):
                  samp_rate=48e3,     # sampling rate [Hz]
                  winsize=512,        # FFT window size [samples]
                  shift=128,          # FFT window shift size [samples]
+                 mem_limit=None,     # memory budget for chunked FFT [bytes] (None: FFT at once)
+                 mmap_dir=None,      # directory for memory-mapped FFT results (None: in memory)
+                 precision='double', # 'double' (float64/complex128) or 'single' (float32/complex64)
+                 fft_backend='numpy',# FFT backend ('numpy', 'scipy', 'pyfftw' or 'auto')
+                 fft_workers=None,   # number of threads for FFT backend (None: all cores)
+                 fft_wisdom=None,    # FFTW wisdom file for pyfftw backend
+                 max_bin=None,       # highest freq bin to keep (None: all bins including DC)
                  ):
         super(SoundShiftFFT, self).__init__(data1, data2, samp_rate, winsize, shift)
 
@@ -45,10 +144,54 @@ class SoundShiftFFT(SignalProcess):
         self.folds = int(self.folds)
         self.max_offset = self.data1.shape[0] - self.folds
 
+        self.mem_limit = mem_limit
+        self.mmap_dir  = mmap_dir
+        # 保持する周波数binの範囲 [bin_lo, bin_hi)
+        #   max_binを指定した場合はDCを除いた1..max_binのみを保持する
+        self.bin_lo, self.bin_hi = bin_range(self.winsize, max_bin)
+        self.precision = precision
+        self.real_dtype, self.dtype = PRECISIONS[precision]
+        # 浮動小数点の入力は指定した精度に揃える
+        if self.data1.dtype.kind == 'f' and self.data1.dtype != self.real_dtype:
+            self.data1 = self.data1.astype(self.real_dtype)
+            self.data2 = self.data2.astype(self.real_dtype)
+        # FFTの計算方法
+        self.fft = get_backend(fft_backend, self.winsize, self.real_dtype, fft_workers, fft_wisdom)
+        # 窓関数 (1行分のみ保持してbroadcastする)
+        self.window = np.hamming(self.winsize).astype(self.real_dtype)
+        # 作成したmemmapファイル (インスタンス破棄時に削除)
+        self.mmap_files = []
+        weakref.finalize(self, remove_files, self.mmap_files)
+
         return
 
     #----------------------------------------------------------------------
     def fft_all(self):
+        # メモリ上限やmemmap出力が指定されていればブロックごとに計算
+        if self.mem_limit is not None or self.mmap_dir is not None:
+            return self.fft_chunked()
+
+        # 全FFT offsetのフレームに窓関数をかけてそれぞれの行をFFT
+        self.fft_data1 = self.spectrum(self.frames(self.data1, 0, self.max_offset))
+        self.fft_data2 = self.spectrum(self.frames(self.data2, 0, self.max_offset))
+
+        return
+
+    #----------------------------------------------------------------------
+    # 窓関数をかけて各行をFFTし，bin_lo..bin_hi-1の周波数binのみ返す
+    def spectrum(self, frames, bin_lo=None, bin_hi=None):
+        if bin_lo is None:
+            bin_lo, bin_hi = self.bin_lo, self.bin_hi
+
+        ret = self.fft.rfft(self.window * frames)
+        if bin_lo != 0 or bin_hi != ret.shape[1]:
+            ret = ret[:,bin_lo:bin_hi]
+        # 必要なbinのみのコピーにしてFFT結果全体を解放する
+        return np.ascontiguousarray(ret, dtype=self.dtype)
+
+    #----------------------------------------------------------------------
+    # start番目からstop-1番目までのFFT offsetに対応するフレームを並べた行列
+    def frames(self, data, start, stop):
         # データをずらして並べた行列を作成 for FFT
         # self.folds = 4で入力データが
         # array([[ 0,  1,  2,  3,  4],
@@ -57,29 +200,92 @@ class SoundShiftFFT(SignalProcess):
         #        [15, 16, 17, 18, 19],
         #        [20, 21, 22, 23, 24],
         #        ...
-        # のとき，こんなような行列shift_dataを作る
+        # のとき，こんなような行列を作る
         # array([[   0,    1,    2, ...,   17,   18,   19],
         #        [   5,    6,    7, ...,   22,   23,   24],
         #        [  10,   11,   12, ...,   27,   28,   29],
         #        ...
-        shift_data1 = np.empty([self.folds,
-                                self.max_offset,
-                                self.shift],
-                               dtype=np.float)
-        shift_data2 = np.empty(shift_data1.shape, dtype=np.float)
+        # dataがメモリ上で連続していればstrideを指定したviewとしてコピーせずに作る
+        if data.flags.c_contiguous:
+            flat = data.reshape(-1)
+            return np.lib.stride_tricks.as_strided(flat[start*self.shift:],
+                                                   shape=(stop - start, self.winsize),
+                                                   strides=(self.shift * flat.itemsize, flat.itemsize),
+                                                   writeable=False)
+
+        # 連続していなければずらしたコピーを並べて作る
+        shift_data = np.empty([self.folds,
+                               stop - start,
+                               self.shift],
+                              dtype=data.dtype)
         for cnt in range(self.folds):
-            shift_data1[cnt,:,:] = self.data1[cnt:-self.folds+cnt,:]
-            shift_data2[cnt,:,:] = self.data2[cnt:-self.folds+cnt,:]
-        shift_data1 = shift_data1.transpose([1,0,2]).reshape(-1, self.winsize)
-        shift_data2 = shift_data2.transpose([1,0,2]).reshape(-1, self.winsize)
+            shift_data[cnt,:,:] = data[start+cnt:stop+cnt,:]
+        return shift_data.transpose([1,0,2]).reshape(-1, self.winsize)
+
+    #----------------------------------------------------------------------
+    # 1ブロックで処理するFFT offset数
+    def block_frames(self):
+        if self.mem_limit is None:
+            return self.max_offset
+        # 1フレームあたりの一時領域
+        #   窓関数をかけた行列 + FFT結果 (+ strideで作れない場合はフレーム行列のコピー)
+        #   FFT結果は倍精度で見積もる
+        frame_bytes = self.winsize * np.dtype(np.float64).itemsize \
+          + (self.winsize//2 + 1) * np.dtype(np.complex128).itemsize
+        if not self.data1.flags.c_contiguous:
+            frame_bytes += self.winsize * self.data1.itemsize
+        return int(max(1, min(self.max_offset, self.mem_limit // frame_bytes)))
+
+    #----------------------------------------------------------------------
+    # FFT結果の格納先を確保
+    #   mmap_dirが指定されていればその下に.npyファイルとして作成
+    def alloc_result(self, shape, dtype, filename=None):
+        if filename is None and self.mmap_dir is None:
+            return np.empty(shape, dtype=dtype)
+
+        if filename is None:
+            fd, filename = tempfile.mkstemp(suffix=".npy", prefix="fft_", dir=self.mmap_dir)
+            os.close(fd)
+            self.mmap_files.append(filename)
+        return np.lib.format.open_memmap(filename, mode='w+', dtype=dtype, shape=shape)
+
+    #----------------------------------------------------------------------
+    # メモリ上限内でブロックごとにFFT
+    #   file1, file2を指定した場合はその.npyファイルに結果を書き込む
+    #   bin_lo, bin_hiを指定した場合はその範囲の周波数binを保持
+    def fft_chunked(self, file1=None, file2=None, bin_lo=None, bin_hi=None):
+        if bin_lo is None:
+            bin_lo, bin_hi = self.bin_lo, self.bin_hi
+        shape = (self.max_offset, bin_hi - bin_lo)
+        self.fft_data1 = self.alloc_result(shape, self.dtype, file1)
+        self.fft_data2 = self.alloc_result(shape, self.dtype, file2)
+
+        block = self.block_frames()
+        for start in range(0, self.max_offset, block):
+            stop = min(start + block, self.max_offset)
+            self.fft_data1[start:stop,:] = self.spectrum(self.frames(self.data1, start, stop), bin_lo, bin_hi)
+            self.fft_data2[start:stop,:] = self.spectrum(self.frames(self.data2, start, stop), bin_lo, bin_hi)
+
+        if isinstance(self.fft_data1, np.memmap):
+            self.fft_data1.flush()
+            self.fft_data2.flush()
 
-        # 窓関数
-        win = np.tile(np.hamming(self.winsize), [shift_data1.shape[0], 1])
+        return
 
-        # それぞれの行をFFT
-        self.fft_data1 = np.fft.rfft(win * shift_data1)
-        self.fft_data2 = np.fft.rfft(win * shift_data2)
+    #----------------------------------------------------------------------
+    # 参照されたFFT offsetのみを計算する
+    def fft_lazy(self):
+        self.fft_data1 = LazySpectrum(self, self.data1)
+        self.fft_data2 = LazySpectrum(self, self.data2)
+        return
 
+    #----------------------------------------------------------------------
+    # 指定したFFT offsetのFFTをまとめて計算しておく
+    #   fft_lazy()を使っていなければ何もしない
+    def prefetch(self, offsets):
+        if isinstance(self.fft_data1, LazySpectrum):
+            self.fft_data1.prefetch(offsets)
+            self.fft_data2.prefetch(offsets)
         return
 
     #----------------------------------------------------------------------
@@ -91,20 +297,141 @@ class SoundShiftFFT(SignalProcess):
         samp_len = len(time_deltas)
         
         # shift量 (時間sample)
-        m = np.array(time_deltas * self.samp_rate, dtype=np.int)
+        m = np.array(time_deltas * self.samp_rate, dtype=np.int64)
 
-        # 各周波数ステップでshift量を計算
-        # まずはexpの肩を計算 -j2\pi m / N
-        exps = np.tile(-2j*np.pi*m/self.winsize, [self.fft_data1.shape[1],1]).T
-        # kをかけて -j2\pi k m / Nにする
-        exps *= np.tile(np.fft.rfftfreq(self.winsize, 1/self.winsize), [samp_len,1])
-        # phase shiftを計算
-        phase_shifts = np.exp(exps)
+        # 各FFT offsetのphase shift exp(-j2\pi k m / N)
+        #   (保持している周波数binの分のみ，mごとの表から引く)
+        phase_shifts = self.phase_shifts(m)
 
         merged_fft = self.fft_data1[offset:offset+samp_len,:]*phase_shifts + self.fft_data2[offset:offset+samp_len]
 
         return merged_fft
 
+    #----------------------------------------------------------------------
+    # 整数shift量mに対するphase shift (m.shape + (bins,))
+    def phase_shifts(self, m):
+        kernel = phase_kernel(self.winsize, self.bin_lo, self.fft_data1.shape[1], self.dtype)
+        return kernel(m)
+
+    #----------------------------------------------------------------------
+    # 複数車両分のshift_merge_fftをまとめて計算
+    #   返り値: (merged_fft (N x samp_len x bins), 有効なFFT offsetを示すmask (N x samp_len))
+    #   データの範囲外のFFT offsetは0とする
+    def shift_merge_fft_batch(self,
+                              time_deltas,  # 時間差 [s] (N x samp_len のnp.array)
+                              offsets,      # 各車両の参照開始位置 (N要素のnp.array, FFT sampleで)
+                              ):
+        samp_len = time_deltas.shape[1]
+
+        # 参照するFFT offset
+        idx = np.asarray(offsets)[:,np.newaxis] + np.arange(samp_len)
+        mask = (idx >= 0) & (idx < self.fft_data1.shape[0])
+        idx = np.clip(idx, 0, self.fft_data1.shape[0] - 1)
+
+        # shift量 (時間sample)
+        m = np.array(time_deltas * self.samp_rate, dtype=np.int64)
+
+        # phase shift exp(-j2\pi k m / N) をmごとの表から引く
+        phase_shifts = self.phase_shifts(m)
+
+        merged_fft = self.fft_data1[idx]
+        merged_fft *= phase_shifts
+        merged_fft += self.fft_data2[idx]
+        merged_fft[~mask] = 0
+
+        return merged_fft, mask
+
+#==========================================================================
+# 長さlengthの配列に対するindex key (slice, 整数, 整数配列, bool配列) を
+# 0..length-1のoffsetに変換 (np.arange(length)[key]と同じ結果)
+#   np.arange(length)を作らないので，参照する範囲の大きさのみのメモリで済む
+def resolve_index(key, length):
+    if isinstance(key, slice):
+        return np.arange(*key.indices(length))
+
+    offsets = np.asarray(key)
+    if offsets.dtype == bool:
+        if offsets.shape != (length,):
+            raise IndexError("boolean index of shape %s does not match length %d" % (offsets.shape, length))
+        return np.flatnonzero(offsets)
+    if not np.issubdtype(offsets.dtype, np.integer):
+        raise IndexError("only integers, slices and integer or boolean arrays are valid indices")
+    if np.any((offsets < -length) | (offsets >= length)):
+        raise IndexError("index out of bounds for length %d" % length)
+    return np.where(offsets < 0, offsets + length, offsets)
+
+#==========================================================================
+# 必要になったFFT offsetのみFFTを計算して保持する配列
+#   fft_data1[idx], fft_data1[start:stop,:]のようにnp.ndarrayと同じく参照できる
+class LazySpectrum():
+    def __init__(self, sig, data):
+        self.sig  = sig         # SoundShiftFFT instance
+        self.data = data        # 時間信号 (sig.data1 or sig.data2)
+
+        self.shape = (sig.max_offset, sig.bin_hi - sig.bin_lo)
+        self.ndim  = 2
+        self.dtype = np.dtype(sig.dtype)
+
+        # 各FFT offsetのFFT結果が格納されているstoreの行番号 (未計算は-1)
+        self.rows  = np.full(self.shape[0], -1, dtype=np.int64)
+        # 計算済みのFFT結果
+        self.store = np.empty([0, self.shape[1]], dtype=self.dtype)
+        self.count = 0
+        # 複数スレッドからの同時計算を防ぐ
+        self.lock  = threading.Lock()
+
+        return
+
+    #----------------------------------------------------------------------
+    def __len__(self):
+        return self.shape[0]
+
+    #----------------------------------------------------------------------
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        # FFT offsetに変換
+        offsets = resolve_index(key[0], self.shape[0])
+        self.prefetch(offsets)
+
+        ret = self.store[self.rows[offsets]]
+        if len(key) == 1:
+            return ret
+        if np.ndim(offsets) == 0:
+            return ret[key[1:]]
+        return ret[(slice(None),) + key[1:]]
+
+    #----------------------------------------------------------------------
+    # 未計算のFFT offsetを計算してstoreに追加
+    def prefetch(self, offsets):
+        with self.lock:
+            self.calc(offsets)
+        return
+
+    #----------------------------------------------------------------------
+    def calc(self, offsets):
+        offsets = np.unique(offsets)
+        offsets = offsets[self.rows[offsets] < 0]
+        if len(offsets) == 0:
+            return
+
+        # storeの拡張 (倍々で確保)
+        if self.count + len(offsets) > self.store.shape[0]:
+            store = np.empty([max(self.count + len(offsets), self.store.shape[0]*2), self.shape[1]],
+                             dtype=self.dtype)
+            store[:self.count] = self.store[:self.count]
+            self.store = store
+
+        frames = self.sig.frames(self.data, 0, self.sig.max_offset)
+        block = self.sig.block_frames()
+        for start in range(0, len(offsets), block):
+            idx = offsets[start:start+block]
+            self.store[self.count:self.count+len(idx)] = self.sig.spectrum(frames[idx])
+            self.rows[idx] = np.arange(self.count, self.count + len(idx))
+            self.count += len(idx)
+
+        return
+
 #==========================================================================
 if __name__ == '__main__':
     import matplotlib.pyplot as plt
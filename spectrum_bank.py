@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+
+import numpy as np
+from soundmap.wave_data import WaveData
+
+from sound_shift_fft import SoundShiftFFT
+
+#==========================================================================
+# 複数の (fft_len, fft_shift) の組み合わせのFFT結果をまとめて保持
+#   wavファイルの読み込みは1回のみ
+#   同じfft_lenでfft_shiftが別のfft_shiftの倍数になっている場合は
+#   小さいfft_shiftのFFT結果を間引いたviewとして共有する
+class SpectrumBank():
+    def __init__(self,
+                 resolutions,        # list of (fft_len, fft_shift)
+                 precision='double', # 'double' or 'single'
+                 mem_limit=None,     # memory budget for chunked FFT [bytes]
+                 mmap_dir=None,      # directory for memory-mapped FFT results
+                 fft_backend='numpy',# FFT backend ('numpy', 'scipy', 'pyfftw' or 'auto')
+                 fft_workers=None,   # number of threads for FFT backend
+                 fft_wisdom=None,    # FFTW wisdom file for pyfftw backend
+                 cutoff=None,        # highest frequency to keep [Hz] (None: all)
+                 ):
+        self.resolutions = sorted(set([(int(l), int(s)) for l, s in resolutions]))
+        self.precision = precision
+        self.mem_limit = mem_limit
+        self.mmap_dir  = mmap_dir
+        self.fft_backend = fft_backend
+        self.fft_workers = fft_workers
+        self.fft_wisdom  = fft_wisdom
+        self.cutoff      = cutoff
+
+        self.sigs = {}  # SoundShiftFFT instance for each resolution name
+        self.wavfile = None
+
+        return
+
+    #----------------------------------------------------------------------
+    # 解像度の名前 (例: "2048_256")
+    @staticmethod
+    def name(fft_len, fft_shift):
+        return "%d_%d" % (fft_len, fft_shift)
+
+    #----------------------------------------------------------------------
+    def names(self):
+        return [self.name(l, s) for l, s in self.resolutions]
+
+    #----------------------------------------------------------------------
+    def get(self, name):
+        return self.sigs[name]
+
+    #----------------------------------------------------------------------
+    def load_sound(self, wavfile):
+        self.wavfile = wavfile
+        wav = WaveData(wavfile, decimate=False)
+        self.fft(np.array(wav.left), np.array(wav.right), wav.sample_rate)
+        del wav
+        return
+
+    #----------------------------------------------------------------------
+    # 全解像度のFFT
+    def fft(self, data1, data2, samp_rate):
+        self.sigs = {}
+        for fft_len, fft_shift in self.resolutions:
+            max_bin = None
+            if self.cutoff is not None:
+                max_bin = int(np.round(fft_len * self.cutoff / samp_rate))
+            sig = SoundShiftFFT(data1, data2,
+                                samp_rate,
+                                fft_len,
+                                fft_shift,
+                                mem_limit = self.mem_limit,
+                                mmap_dir  = self.mmap_dir,
+                                precision = self.precision,
+                                fft_backend = self.fft_backend,
+                                fft_workers = self.fft_workers,
+                                fft_wisdom  = self.fft_wisdom,
+                                max_bin     = max_bin,
+                                )
+
+            # fft_shiftを割り切る最大のfft_shiftで計算済みのものを探す
+            #   (resolutionsはfft_shiftの昇順に並んでいる)
+            base = None
+            for l, s in self.resolutions:
+                if l == fft_len and s < fft_shift and fft_shift % s == 0 \
+                   and self.name(l, s) in self.sigs:
+                    base = self.sigs[self.name(l, s)]
+
+            if base is None:
+                sig.fft_all()
+            else:
+                # FFT offset i*fft_shiftは計算済みのi*(fft_shift/s)番目と同じ
+                step = fft_shift // base.shift
+                sig.fft_data1 = base.fft_data1[::step][:sig.max_offset]
+                sig.fft_data2 = base.fft_data2[::step][:sig.max_offset]
+
+            self.sigs[self.name(fft_len, fft_shift)] = sig
+
+        return
+
+#==========================================================================
+if __name__ == '__main__':
+    pass
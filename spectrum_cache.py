@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+
+import os
+import glob
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+#==========================================================================
+# SHA-1 hash of the file content
+#   hashes are remembered in memo_file by (path, size, mtime)
+#   to skip reading large files again
+def file_hash(filename, memo_file=None, block_size=2**24):
+    path = os.path.realpath(filename)
+    stat = os.stat(path)
+    stamp = [stat.st_size, stat.st_mtime_ns]
+
+    memo = {}
+    if memo_file is not None and os.path.exists(memo_file):
+        try:
+            with open(memo_file) as f:
+                memo = json.load(f)
+        except ValueError:
+            memo = {}
+        if path in memo and memo[path][:2] == stamp:
+            return memo[path][2]
+
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha1.update(block)
+    digest = sha1.hexdigest()
+
+    if memo_file is not None:
+        memo[path] = stamp + [digest]
+        fd, tmpfile = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(memo_file)))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(memo, f)
+        os.replace(tmpfile, memo_file)
+
+    return digest
+
+#==========================================================================
+# on-disk cache of SoundShiftFFT results
+#   each entry is a pair of .npy files (left and right) loaded as memmap
+#   and named <wav hash>_<fft_len>_<fft_shift>_<dtype>_<FFT backend>_<number of freq bins>_{1,2}.npy
+#   (results of different backends differ in rounding and are not shared)
+class SpectrumCache():
+    def __init__(self,
+                 cache_dir,     # cache directory
+                 max_size=None, # maximum total size of cache in bytes (None: unlimited)
+                 ):
+        self.cache_dir = cache_dir
+        self.max_size  = max_size
+        self.memo_file = os.path.join(cache_dir, "hashes.json")
+
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+        return
+
+    #----------------------------------------------------------------------
+    def entry_base(self, wav_hash, sig, n_bins):
+        return os.path.join(self.cache_dir,
+                            "%s_%d_%d_%s_%s_%d" % (wav_hash, sig.winsize, sig.shift,
+                                                   np.dtype(sig.dtype).name, sig.fft.name, n_bins))
+
+    #----------------------------------------------------------------------
+    # find an entry including at least n_bins freq bins
+    def find(self, wav_hash, sig, n_bins):
+        pattern = self.entry_base(wav_hash, sig, 0)[:-1] + "*_1.npy"
+        candidates = []
+        for file1 in glob.glob(pattern):
+            entry = file1[:-len("_1.npy")]
+            stored_bins = int(entry.split("_")[-1])
+            if stored_bins >= n_bins and os.path.exists(entry + "_2.npy"):
+                candidates.append((stored_bins, entry))
+        if len(candidates) == 0:
+            return None
+        # prefer the smallest entry
+        return min(candidates)[1]
+
+    #----------------------------------------------------------------------
+    # load cached FFT results into sig
+    #   returns False if not cached
+    def load(self, wavfile, sig):
+        wav_hash = file_hash(wavfile, self.memo_file)
+
+        entry = self.find(wav_hash, sig, sig.bin_hi)
+        if entry is None:
+            return False
+
+        try:
+            fft_data1 = np.load(entry + "_1.npy", mmap_mode='r')
+            fft_data2 = np.load(entry + "_2.npy", mmap_mode='r')
+        except (IOError, ValueError):
+            # removed by other processes or broken
+            return False
+        sig.fft_data1 = fft_data1[:,sig.bin_lo:sig.bin_hi]
+        sig.fft_data2 = fft_data2[:,sig.bin_lo:sig.bin_hi]
+
+        # update last access time for LRU eviction
+        self.touch(entry)
+
+        return True
+
+    #----------------------------------------------------------------------
+    # calculate FFT of sig and store the results in cache
+    #   freq bins from DC to n_bins-1 are stored (all bins if n_bins is None)
+    def store(self, wavfile, sig, n_bins=None):
+        if n_bins is None:
+            n_bins = sig.winsize//2 + 1
+        n_bins = max(n_bins, sig.bin_hi)
+        wav_hash = file_hash(wavfile, self.memo_file)
+        entry = self.entry_base(wav_hash, sig, n_bins)
+
+        # write in temporary files and rename to avoid exposing incomplete entries
+        tmpfiles = []
+        for ch in [1, 2]:
+            fd, tmpfile = tempfile.mkstemp(suffix=".npy.tmp", dir=self.cache_dir)
+            os.close(fd)
+            tmpfiles.append(tmpfile)
+        try:
+            sig.fft_chunked(tmpfiles[0], tmpfiles[1], 0, n_bins)
+            os.replace(tmpfiles[0], entry + "_1.npy")
+            os.replace(tmpfiles[1], entry + "_2.npy")
+            sig.fft_data1 = sig.fft_data1[:,sig.bin_lo:sig.bin_hi]
+            sig.fft_data2 = sig.fft_data2[:,sig.bin_lo:sig.bin_hi]
+        except BaseException:
+            for f in tmpfiles:
+                if os.path.exists(f):
+                    os.remove(f)
+            raise
+
+        self.evict(keep=entry)
+
+        return
+
+    #----------------------------------------------------------------------
+    def touch(self, entry):
+        for ch in [1, 2]:
+            try:
+                os.utime("%s_%d.npy" % (entry, ch))
+            except OSError:
+                pass
+        return
+
+    #----------------------------------------------------------------------
+    # remove least recently used entries until cache size gets within max_size
+    def evict(self, keep=None):
+        if self.max_size is None:
+            return
+
+        entries = {}
+        for f in glob.glob(os.path.join(self.cache_dir, "*_[12].npy")):
+            entry = f[:-len("_1.npy")]
+            try:
+                stat = os.stat(f)
+            except OSError:
+                continue
+            size, last = entries.get(entry, (0, 0))
+            entries[entry] = (size + stat.st_size, max(last, stat.st_mtime))
+
+        total = sum([size for size, last in entries.values()])
+        for entry in sorted(entries.keys(), key=lambda x: entries[x][1]):
+            if total <= self.max_size:
+                break
+            if entry == keep:
+                continue
+            for ch in [1, 2]:
+                try:
+                    os.remove("%s_%d.npy" % (entry, ch))
+                except OSError:
+                    pass
+            total -= entries[entry][0]
+
+        return
+
+#==========================================================================
+if __name__ == '__main__':
+    pass
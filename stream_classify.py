@@ -0,0 +1,497 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+
+import sys
+import time
+import queue
+import socket
+import threading
+import numpy as np
+
+from sound_shift_fft import PRECISIONS, SoundShiftFFT, bin_range, resolve_index
+from fft_backend import get_backend
+
+#==========================================================================
+# ring buffer of recent FFT results
+#   indexed by absolute FFT offset from the start of the stream,
+#   only the latest `capacity` offsets are kept
+class RingSpectrum():
+    def __init__(self, capacity, n_bins, dtype=np.complex128):
+        self.capacity = capacity
+        self.data  = np.zeros([capacity, n_bins], dtype=dtype)
+        self.count = 0 # number of FFT offsets pushed so far
+        self.ndim  = 2
+        self.dtype = self.data.dtype
+        return
+
+    #----------------------------------------------------------------------
+    @property
+    def shape(self):
+        return (self.count, self.data.shape[1])
+
+    #----------------------------------------------------------------------
+    def __len__(self):
+        return self.count
+
+    #----------------------------------------------------------------------
+    # oldest FFT offset still kept in the buffer
+    def first(self):
+        return max(0, self.count - self.capacity)
+
+    #----------------------------------------------------------------------
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        # absolute FFT offsets (without allocating the whole stream history)
+        offsets = resolve_index(key[0], self.count)
+        if np.any(offsets < self.first()):
+            raise IndexError("FFT offset %d is already dropped from ring buffer" % np.min(offsets))
+
+        ret = self.data[offsets % self.capacity]
+        if len(key) == 1:
+            return ret
+        if np.ndim(offsets) == 0:
+            return ret[key[1:]]
+        return ret[(slice(None),) + key[1:]]
+
+    #----------------------------------------------------------------------
+    def push(self, spectra):
+        # keep only the latest part if spectra is longer than the buffer
+        if len(spectra) > self.capacity:
+            self.count += len(spectra) - self.capacity
+            spectra = spectra[-self.capacity:]
+        rows = (self.count + np.arange(len(spectra))) % self.capacity
+        self.data[rows] = spectra
+        self.count += len(spectra)
+        return
+
+#==========================================================================
+# incremental version of SoundShiftFFT
+#   FFT offsets are numbered in the same way as SoundShiftFFT.fft_all
+#   (offset i starts from i*shift samples of the stream)
+class StreamShiftFFT():
+    def __init__(self,
+                 samp_rate=48e3,     # sampling rate [Hz]
+                 winsize=512,        # FFT window size [samples]
+                 shift=128,          # FFT window shift size [samples]
+                 capacity=4096,      # number of FFT offsets kept in ring buffer
+                 precision='double', # 'double' or 'single'
+                 fft_backend='numpy',# FFT backend ('numpy', 'scipy', 'pyfftw' or 'auto')
+                 fft_workers=None,   # number of threads for FFT backend
+                 fft_wisdom=None,    # FFTW wisdom file for pyfftw backend
+                 max_bin=None,       # highest freq bin to keep (None: all bins including DC)
+                 ):
+        self.samp_rate = samp_rate
+        self.winsize   = winsize
+        self.shift     = shift
+        self.folds     = int(winsize / shift)
+        self.bin_lo, self.bin_hi = bin_range(winsize, max_bin)
+        self.precision = precision
+        self.real_dtype, self.dtype = PRECISIONS[precision]
+        self.window = np.hamming(self.winsize).astype(self.real_dtype)
+        self.fft = get_backend(fft_backend, self.winsize, self.real_dtype, fft_workers, fft_wisdom)
+
+        self.fft_data1 = RingSpectrum(capacity, self.bin_hi - self.bin_lo, self.dtype)
+        self.fft_data2 = RingSpectrum(capacity, self.bin_hi - self.bin_lo, self.dtype)
+
+        # samples not yet covered by a full FFT window
+        self.tail1 = np.empty(0, dtype=self.real_dtype)
+        self.tail2 = np.empty(0, dtype=self.real_dtype)
+        # number of samples pushed so far
+        self.samples = 0
+
+        return
+
+    #----------------------------------------------------------------------
+    # stream time in second
+    def time(self):
+        return self.samples / self.samp_rate
+
+    #----------------------------------------------------------------------
+    # push a block of stereo samples and FFT the completed windows
+    def push(self, data1, data2):
+        self.samples += len(data1)
+        buf1 = np.concatenate([self.tail1, np.asarray(data1, dtype=self.real_dtype)])
+        buf2 = np.concatenate([self.tail2, np.asarray(data2, dtype=self.real_dtype)])
+
+        n = 0
+        if len(buf1) >= self.winsize:
+            n = (len(buf1) - self.winsize) // self.shift + 1
+            self.fft_data1.push(self.spectrum(self.frames(buf1, n)))
+            self.fft_data2.push(self.spectrum(self.frames(buf2, n)))
+
+        self.tail1 = buf1[n*self.shift:]
+        self.tail2 = buf2[n*self.shift:]
+
+        return n
+
+    #----------------------------------------------------------------------
+    # n overlapping frames of buf as a strided view
+    def frames(self, buf, n):
+        return np.lib.stride_tricks.as_strided(buf,
+                                               shape=(n, self.winsize),
+                                               strides=(self.shift * buf.itemsize, buf.itemsize),
+                                               writeable=False)
+
+    #----------------------------------------------------------------------
+    spectrum              = SoundShiftFFT.spectrum
+    phase_shifts          = SoundShiftFFT.phase_shifts
+    shift_merge_fft       = SoundShiftFFT.shift_merge_fft
+    shift_merge_fft_batch = SoundShiftFFT.shift_merge_fft_batch
+
+#==========================================================================
+# classify passing vehicles from streaming audio
+#   vehicle passage events (t0, v) are classified as soon as
+#   win/2 seconds of audio after t0 are available
+class StreamClassifier():
+    def __init__(self,
+                 ext,             # feature extraction class instance (ExtFeature)
+                 estimate,        # estimation class instance with trained model
+                 samp_rate=48e3,  # sampling rate [Hz]
+                 type_ids=None,   # vehicle type names for type ids
+                 margin=2.0,      # extra audio kept in ring buffer in second
+                 ):
+        self.ext      = ext
+        self.estimate = estimate
+        self.type_ids = type_ids
+
+        # ring buffer keeps the window of a vehicle plus margin
+        samp_int = ext.fft_shift / samp_rate
+        capacity = int((ext.win + margin) / samp_int) + ext.fft_len // ext.fft_shift
+        self.sig = StreamShiftFFT(samp_rate,
+                                  ext.fft_len,
+                                  ext.fft_shift,
+                                  capacity    = capacity,
+                                  precision   = ext.precision,
+                                  fft_backend = ext.fft_backend,
+                                  fft_workers = ext.fft_workers,
+                                  fft_wisdom  = ext.fft_wisdom,
+                                  max_bin     = ext.max_bin(samp_rate),
+                                  )
+        ext.set_signal(self.sig)
+
+        self.events  = []    # pending events: (t0, v, received wall time)
+        self.results = []    # classification results
+        self.queue   = None  # event queue polled in feed()
+
+        return
+
+    #----------------------------------------------------------------------
+    # add vehicle passage event
+    def add_event(self, t0, v):
+        self.events.append((t0, v, time.perf_counter()))
+        self.events.sort()
+        return
+
+    #----------------------------------------------------------------------
+    # last FFT offset required to classify a vehicle passing at t0
+    def last_offset(self, t0):
+        return int(np.round(t0 / self.ext.samp_int)) + int(self.ext.winlen/2) - 1
+
+    #----------------------------------------------------------------------
+    # feed a block of stereo samples and classify ready events
+    #   returns list of classification results for this block
+    def feed(self, data1, data2):
+        arrival = time.perf_counter()
+        self.poll()
+        self.sig.push(data1, data2)
+
+        ret = []
+        while len(self.events) > 0 and self.last_offset(self.events[0][0]) < self.sig.fft_data1.count:
+            t0, v, received = self.events.pop(0)
+            try:
+                result = self.classify(t0, v)
+            except IndexError:
+                sys.stderr.write("Warning: event at t0=%.2f is too old for ring buffer\n" % t0)
+                continue
+            end = time.perf_counter()
+            # processing latency after the required audio arrived
+            result['latency'] = end - max(arrival, received)
+            # latency in stream time from t0
+            result['stream_latency'] = self.sig.time() - t0
+            self.results.append(result)
+            ret.append(result)
+
+        return ret
+
+    #----------------------------------------------------------------------
+    # classify a vehicle by majority vote over feature rows
+    def classify(self, t0, v):
+        features = self.ext.feature(t0, v)
+        est = self.estimate.predict(features)
+        labels, counts = np.unique(est, return_counts=True)
+        type_id = int(labels[np.argmax(counts)])
+
+        return {'t0':        t0,
+                'v':         v,
+                'type_id':   type_id,
+                'type':      None if self.type_ids is None else self.type_ids[type_id],
+                'votes':     np.max(counts) / len(est),
+                }
+
+    #----------------------------------------------------------------------
+    # take events from queue.Queue filled by other threads
+    def poll(self):
+        if self.queue is None:
+            return
+        while True:
+            try:
+                t0, v = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            self.add_event(t0, v)
+        return
+
+    #----------------------------------------------------------------------
+    # latency statistics of classified events
+    def latency_stats(self):
+        if len(self.results) == 0:
+            return None
+        ret = {}
+        for key in ['latency', 'stream_latency']:
+            lat = np.array([r[key] for r in self.results])
+            ret[key] = {'mean': np.mean(lat),
+                        'p50':  np.percentile(lat, 50),
+                        'p95':  np.percentile(lat, 95),
+                        'max':  np.max(lat),
+                        }
+        return ret
+
+#==========================================================================
+# receive vehicle passage events through UDP socket
+#   each datagram includes lines of "t0<TAB>v"
+class EventReceiver(threading.Thread):
+    def __init__(self, event_queue, host="127.0.0.1", port=50007):
+        super(EventReceiver, self).__init__()
+        self.daemon = True
+        self.queue  = event_queue
+        self.sock   = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        return
+
+    #----------------------------------------------------------------------
+    def run(self):
+        while True:
+            data, addr = self.sock.recvfrom(4096)
+            for line in data.decode().splitlines():
+                try:
+                    t0, v = [float(x) for x in line.split()[:2]]
+                except ValueError:
+                    sys.stderr.write("Warning: ignore invalid event \"%s\"\n" % line)
+                    continue
+                self.queue.put((t0, v))
+        return
+
+#==========================================================================
+# print a classification result
+def print_result(result):
+    print("t0=%.2f v=%.1f type=%s (%d) votes=%.2f latency=%.1fms stream_latency=%.2fs" % (
+        result['t0'], result['v'], result['type'], result['type_id'], result['votes'],
+        result['latency']*1e3, result['stream_latency']))
+    return
+
+#----------------------------------------------------------------------
+def print_latency(classifier):
+    stats = classifier.latency_stats()
+    if stats is None:
+        print("no events classified")
+        return
+    print("processing latency [ms]: mean=%.2f p50=%.2f p95=%.2f max=%.2f" % tuple(
+        [stats['latency'][k]*1e3 for k in ['mean', 'p50', 'p95', 'max']]))
+    print("stream latency [s]: mean=%.2f p50=%.2f p95=%.2f max=%.2f" % tuple(
+        [stats['stream_latency'][k] for k in ['mean', 'p50', 'p95', 'max']]))
+    return
+
+#----------------------------------------------------------------------
+# create feature extraction and estimation instances from config
+def load_config(conffile, model_file):
+    from main import load_class, create_ext_feature
+
+    config = load_class(conffile)
+    ext = create_ext_feature(load_class(config.ext_feature_class), config)
+    est = load_class(config.est_class).Estimate()
+    type_ids = est.load_model(model_file)
+
+    return config, ext, est, type_ids
+
+#----------------------------------------------------------------------
+# train model with all vehicles in config and save it
+def train(args):
+    from main import load_class, create_ext_feature, create_vehicles
+
+    config = load_class(args.conffile)
+    ext = create_ext_feature(load_class(config.ext_feature_class), config)
+    print("load sound data %s" % config.wavfile)
+    ext.load_sound(config.wavfile)
+
+    veh = create_vehicles(config, ext)
+    print("load vehicle data %s" % config.vehicle_info)
+    veh.load_data()
+    if 'pre_vehicle' in list(config.__dict__.keys()):
+        config.pre_vehicle(veh)
+
+    e = load_class(config.est_class).Estimate(vehicles=veh)
+    e.feature_extraction()
+    print("train model")
+    e.fit()
+    e.save_model(args.model, veh.type_ids)
+    print("model saved in %s" % args.model)
+
+    return
+
+#----------------------------------------------------------------------
+# replay wav file in blocks with events from vehicle info file
+def replay(args):
+    import vehicles
+    from soundmap.wave_data import WaveData
+
+    config, ext, est, type_ids = load_config(args.conffile, args.model)
+
+    wav = WaveData(args.wavfile, decimate=False)
+    left  = np.array(wav.left)
+    right = np.array(wav.right)
+    samp_rate = wav.sample_rate
+    del wav
+
+    veh = vehicles.Vehicles(args.vehicle_info)
+    veh.load_data()
+    events = list(zip(veh.data.t0, veh.data.v, veh.data.type))
+
+    c = StreamClassifier(ext, est, samp_rate, type_ids)
+
+    correct = 0
+    truth = dict([(t0, vtype) for t0, v, vtype in events])
+    block = int(args.block * samp_rate)
+    for start in range(0, len(left), block):
+        # events are notified when stream time reaches t0
+        now = (start + block) / samp_rate
+        while len(events) > 0 and events[0][0] <= now:
+            t0, v, vtype = events.pop(0)
+            c.add_event(t0, v)
+
+        for result in c.feed(left[start:start+block], right[start:start+block]):
+            print_result(result)
+            if type_ids is not None and result['type'] == truth[result['t0']]:
+                correct += 1
+
+        if args.realtime:
+            time.sleep(block / samp_rate)
+
+    print_latency(c)
+    if type_ids is not None and len(c.results) > 0:
+        print("accuracy=%.4f (%d/%d)" % (correct / len(c.results), correct, len(c.results)))
+
+    return
+
+#----------------------------------------------------------------------
+# classify live audio from sound device with events from UDP socket
+def listen(args):
+    import sounddevice
+
+    config, ext, est, type_ids = load_config(args.conffile, args.model)
+
+    c = StreamClassifier(ext, est, args.samp_rate, type_ids)
+    c.queue = queue.Queue()
+    EventReceiver(c.queue, args.host, args.port).start()
+
+    block = int(args.block * args.samp_rate)
+    with sounddevice.InputStream(samplerate=args.samp_rate, channels=2, blocksize=block) as stream:
+        try:
+            while True:
+                data, overflowed = stream.read(block)
+                if overflowed:
+                    sys.stderr.write("Warning: audio input overflowed\n")
+                for result in c.feed(data[:,0], data[:,1]):
+                    print_result(result)
+        except KeyboardInterrupt:
+            pass
+
+    print_latency(c)
+
+    return
+
+#==========================================================================
+# handle arguments
+def arg_parser():
+    import argparse
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="command")
+    sub.required = True
+
+    ap_train = sub.add_parser("train", help="train model with vehicles in config")
+    ap_train.set_defaults(func=train)
+
+    ap_replay = sub.add_parser("replay", help="classify vehicles replaying a wav file")
+    ap_replay.add_argument("wavfile", type=str, action="store",
+                           help="vehicle sound wavfile",
+                           )
+    ap_replay.add_argument("vehicle_info", type=str, action="store",
+                           help="vehicle info file including passage events",
+                           )
+    ap_replay.add_argument("--realtime", action="store_true",
+                           help="replay in real time",
+                           )
+    ap_replay.set_defaults(func=replay)
+
+    ap_listen = sub.add_parser("listen", help="classify vehicles from sound device (requires sounddevice)")
+    ap_listen.add_argument("--samp_rate", type=float, action="store",
+                           default=48e3,
+                           help="sampling rate",
+                           )
+    ap_listen.add_argument("--host", type=str, action="store",
+                           default="127.0.0.1",
+                           help="address to receive events",
+                           )
+    ap_listen.add_argument("--port", type=int, action="store",
+                           default=50007,
+                           help="UDP port to receive events",
+                           )
+    ap_listen.set_defaults(func=listen)
+
+    for p in [ap_train, ap_replay, ap_listen]:
+        p.add_argument("-c", "--conffile", type=str, action="store",
+                       default="config.py",
+                       help="config file",
+                       )
+        p.add_argument("-m", "--model", type=str, action="store",
+                       default="model.pkl",
+                       help="model file",
+                       )
+    for p in [ap_replay, ap_listen]:
+        p.add_argument("-b", "--block", type=float, action="store",
+                       default=0.1,
+                       help="audio block length in second",
+                       )
+    return ap
+
+#==========================================================================
+if __name__ == '__main__':
+    parser = arg_parser()
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+import os
+import sys
+import numpy as np
+import pytest
+
+# modules are placed in the top directory of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SAMP_RATE = 48000
+DURATION  = 12.0
+FFT_LEN   = 2048
+FFT_SHIFT = 256
+
+#==========================================================================
+# stereo noise with a common source delayed between channels
+@pytest.fixture(scope="session")
+def stereo():
+    rs = np.random.RandomState(0)
+    samples = int(DURATION * SAMP_RATE)
+    source = rs.randn(samples + 64)
+    left  = source[64:] + 0.1 * rs.randn(samples)
+    right = source[:-64] + 0.1 * rs.randn(samples)
+    return left, right
+
+#----------------------------------------------------------------------
+@pytest.fixture(scope="session")
+def wavfile(stereo, tmp_path_factory):
+    from scipy.io import wavfile as wav
+    path = str(tmp_path_factory.mktemp("wav") / "rec.wav")
+    data = np.c_[stereo[0], stereo[1]]
+    wav.write(path, SAMP_RATE, (data / np.max(np.abs(data)) * 2**14).astype(np.int16))
+    return path
+
+#----------------------------------------------------------------------
+# vehicles passing at random, some of them near the edges of the recording
+@pytest.fixture(scope="session")
+def vehicle_info(tmp_path_factory):
+    rs = np.random.RandomState(1)
+    n = 24
+    t0 = np.sort(np.r_[0.3, rs.uniform(0.5, DURATION - 0.5, n - 2), DURATION - 0.2])
+    v = rs.uniform(5, 20, n) * rs.choice([-1, 1], n)
+    types = rs.choice(['normal', 'large', 'bike'], n)
+    path = str(tmp_path_factory.mktemp("veh") / "veh.tsv")
+    with open(path, "w") as f:
+        f.write("id\tt0\tv\ttype\tdir\n")
+        for i in range(n):
+            f.write("%d\t%f\t%f\t%s\t%d\n" % (i, t0[i], v[i], types[i], 1 if v[i] > 0 else -1))
+    return path
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+import os
+import numpy as np
+import pytest
+
+import dataset
+from feature_dataset import FeatureDataset, FeatureDatasetWriter
+
+#==========================================================================
+def write_config(path):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(path, "w") as f:
+        f.write("ext_feature_class = %r\n" % os.path.join(root, "ext_feature_shift_fft.py"))
+        f.write("winsize = 2.0\ncutoff = 3e3\nfft_len = 2048\nfft_shift = 256\n")
+        f.write("ma_len = 10\nma_overlap = True\n")
+    return path
+
+#----------------------------------------------------------------------
+def test_empty_manifest(tmp_path):
+    manifest = str(tmp_path / "manifest.tsv")
+    with open(manifest, "w") as f:
+        f.write("wavfile\tvehicle_info\n")
+    d = dataset.Dataset(manifest, write_config(str(tmp_path / "conf.py")),
+                        str(tmp_path / "out"), workers=1)
+    with pytest.raises(ValueError, match="manifest.tsv"):
+        d.calc_dataset()
+
+#----------------------------------------------------------------------
+# all vehicles pass out of the recording
+def test_manifest_without_rows(tmp_path, wavfile):
+    pytest.importorskip("soundmap")
+    vehicle_info = str(tmp_path / "veh.tsv")
+    with open(vehicle_info, "w") as f:
+        f.write("id\tt0\tv\ttype\tdir\n0\t100.0\t10.0\tnormal\t1\n")
+    manifest = str(tmp_path / "manifest.tsv")
+    with open(manifest, "w") as f:
+        f.write("wavfile\tvehicle_info\n%s\t%s\n" % (wavfile, vehicle_info))
+    d = dataset.Dataset(manifest, write_config(str(tmp_path / "conf.py")),
+                        str(tmp_path / "out"), workers=1)
+    with pytest.raises(ValueError, match="manifest.tsv"):
+        d.calc_dataset()
+    assert sorted(os.listdir(str(tmp_path))) == ["conf.py", "manifest.tsv", "veh.tsv"]
+
+#----------------------------------------------------------------------
+# rows appended part by part are loaded as one dataset (also empty parts)
+@pytest.mark.parametrize("columns", [1, 100000])
+def test_writer(tmp_path, columns):
+    rs = np.random.RandomState(0)
+    parts = [FeatureDataset(rs.randn(rows, columns).astype(np.float32),
+                            rs.randint(0, 3, rows).astype(np.int8),
+                            np.arange(rows), np.full(rows, recording), np.arange(rows) % 4)
+             for recording, rows in enumerate([3, 0, 5])]
+    base = str(tmp_path / "out")
+    writer = FeatureDatasetWriter(base, columns, np.float32, np.int8)
+    for part in parts:
+        writer.append(part)
+    writer.close()
+
+    ds = FeatureDataset.load(base)
+    for field in FeatureDataset.fields:
+        np.testing.assert_array_equal(getattr(ds, field),
+                                      np.concatenate([getattr(p, field) for p in parts]),
+                                      err_msg=field)
+    assert ds.features.dtype == np.float32 and ds.labels.dtype == np.int8
+
+#----------------------------------------------------------------------
+# recordings are consolidated in manifest order and no part files are left
+@pytest.mark.parametrize("workers", [1, 2])
+def test_consolidate(tmp_path, wavfile, vehicle_info, workers):
+    pytest.importorskip("soundmap")
+    manifest = str(tmp_path / "manifest.tsv")
+    with open(manifest, "w") as f:
+        f.write("wavfile\tvehicle_info\n")
+        f.write("%s\t%s\n" % (wavfile, vehicle_info) * 2)
+    d = dataset.Dataset(manifest, write_config(str(tmp_path / "conf.py")),
+                        str(tmp_path / "out"), workers=workers)
+    ds = d.calc_dataset()
+
+    half = len(ds) // 2
+    assert half > 0
+    np.testing.assert_array_equal(ds.recording_ids, np.repeat([0, 1], half))
+    for field in ['features', 'labels', 'vehicle_ids', 'frames']:
+        np.testing.assert_array_equal(getattr(ds, field)[:half], getattr(ds, field)[half:],
+                                      err_msg=field)
+    assert sorted(os.listdir(str(tmp_path))) == (["conf.py", "manifest.tsv"] +
+                                                 ["out_%s.npy" % f for f in sorted(FeatureDataset.fields)])
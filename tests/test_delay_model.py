@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+import threading
+import numpy as np
+import pytest
+
+from conftest import SAMP_RATE, FFT_LEN, FFT_SHIFT
+from delay_model import DelayModel
+
+#==========================================================================
+# cached curves are the exact curves of quantized velocities
+#   also when many threads evict curves from a small cache at the same time
+def test_lookup_threads():
+    model = DelayModel(v_step=0.5, cache_size=4)
+    rel_t = np.linspace(-1, 1, 200)
+    errors = []
+
+    def run(seed):
+        rs = np.random.RandomState(seed)
+        try:
+            for i in range(200):
+                v = rs.uniform(-20, 20, 3)
+                v_q = np.round(v / 0.5) * 0.5
+                np.testing.assert_array_equal(model.lookup(rel_t, v), model(rel_t, v_q, np.zeros(3)))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(seed,)) for seed in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert len(model.curves) <= 4
+
+#----------------------------------------------------------------------
+# features of a vehicle are the same as the ones of N vehicles at once
+# with quantized delay curves
+def test_scalar_and_batched_share_curves(stereo):
+    pytest.importorskip("soundmap")
+    from sound_shift_fft import SoundShiftFFT
+    import ext_feature_shift_fft
+
+    ext = ext_feature_shift_fft.ExtFeature(win=2.0, cutoff=3e3, fft_len=FFT_LEN, fft_shift=FFT_SHIFT,
+                                           delay_v_step=0.5)
+    sig = SoundShiftFFT(stereo[0], stereo[1], SAMP_RATE, FFT_LEN, FFT_SHIFT,
+                        max_bin=ext.max_bin(SAMP_RATE))
+    sig.fft_all()
+    ext.set_signal(sig)
+
+    t0 = np.array([0.3, 3.1, 6.7, 11.9])
+    v  = np.array([12.3, -7.9, 15.05, -18.2])
+    features, mask = ext.features(t0, v)
+    for i in range(len(t0)):
+        np.testing.assert_array_equal(features[i][mask[i]], ext.feature(t0[i], v[i]))
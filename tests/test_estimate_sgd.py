@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+import numpy as np
+import pytest
+from sklearn.linear_model import SGDClassifier
+from sklearn.preprocessing import StandardScaler
+
+import estimate_sgd
+from feature_dataset import FeatureDataset
+
+#==========================================================================
+@pytest.fixture
+def dataset(tmp_path):
+    rs = np.random.RandomState(0)
+    labels = np.repeat(np.arange(3), [50, 70, 80]).astype(np.int8)
+    features = (rs.randn(200, 6) * [1, 2, 3, 4, 5, 6] + labels[:, np.newaxis]).astype(np.float32)
+    ds = FeatureDataset.create(str(tmp_path / "ds"), 200, 6, np.float32, np.int8)
+    ds.features[:] = features
+    ds.labels[:]   = labels
+    return ds
+
+#----------------------------------------------------------------------
+def create_estimate(dataset, batch_size):
+    e = estimate_sgd.Estimate(batch_size=batch_size, epochs=3)
+    e.dataset = dataset
+    e.random_state = 0
+    return e
+
+#==========================================================================
+# streaming scaling and batched prediction are the ones of all rows at once
+@pytest.mark.parametrize("batch_size", [7, 64, 1000])
+def test_batches(dataset, batch_size):
+    x, y = dataset.features, dataset.labels
+    idx = np.arange(3, 200, 3)
+    e = create_estimate(dataset, batch_size)
+    e.fit(x, y, idx)
+
+    scaler = StandardScaler().fit(x[idx])
+    np.testing.assert_allclose(e.scaler.mean_, scaler.mean_, rtol=1e-6)
+    np.testing.assert_allclose(e.scaler.var_, scaler.var_, rtol=1e-5)
+    np.testing.assert_array_equal(e.predict(x, idx), e.model.predict(e.scaler.transform(x[idx])))
+
+#----------------------------------------------------------------------
+# mini-batches read from memmap train the same model as partial_fit
+# on in-memory rows in the same order
+@pytest.mark.parametrize("batch_size", [16, 1000])
+def test_partial_fit(dataset, batch_size):
+    x, y = dataset.features, dataset.labels
+    idx = np.arange(200)
+    e = create_estimate(dataset, batch_size)
+    e.fit()
+
+    x_mem = np.array(x)
+    scaler = StandardScaler().fit(x_mem)
+    model = SGDClassifier(loss='hinge', alpha=1e-4, random_state=0)
+    rs = np.random.RandomState(0)
+    for epoch in range(3):
+        order = rs.permutation(idx)
+        for start in range(0, len(order), batch_size):
+            batch = np.sort(order[start:start+batch_size])
+            model.partial_fit(scaler.transform(x_mem[batch]), y[batch], classes=np.arange(3))
+    np.testing.assert_allclose(e.model.coef_, model.coef_, rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(e.model.intercept_, model.intercept_, rtol=1e-5, atol=1e-6)
+
+#----------------------------------------------------------------------
+# folds are evaluated with the rows of their indices in any order
+def test_eval_indices(dataset):
+    x, y = dataset.features, dataset.labels
+    rs = np.random.RandomState(1)
+    idx = rs.permutation(200)
+    e = create_estimate(dataset, 16)
+    score, conf_mat = e.eval_indices(x, y, idx[:150], idx[150:])
+    assert conf_mat.shape == (3, 3)
+    np.testing.assert_array_equal(conf_mat.sum(axis=1), np.bincount(y[idx[150:]], minlength=3))
+    assert 0 <= score <= 1
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+import numpy as np
+import pytest
+
+import estimate_svm
+from feature_dataset import FeatureDataset
+
+#==========================================================================
+# every class is under-sampled to the smallest class without replacement
+def test_balanced_indices():
+    y = np.repeat(np.arange(3), [5, 30, 12])
+    rs = np.random.RandomState(0)
+    draws = [estimate_svm.Estimate.balanced_indices(y, rs) for i in range(2)]
+    for idx in draws:
+        assert np.all(np.diff(idx) > 0)
+        np.testing.assert_array_equal(np.bincount(y[idx]), [5, 5, 5])
+    # repeats draw different subsets
+    assert not np.array_equal(draws[0], draws[1])
+
+#----------------------------------------------------------------------
+# folds of each repeat split the balanced rows into disjoint train and test rows
+@pytest.mark.filterwarnings("ignore::sklearn.exceptions.ConvergenceWarning")
+def test_validate_splits():
+    rs = np.random.RandomState(0)
+    labels = np.repeat(np.arange(3), [20, 35, 50]).astype(np.int8)
+    e = estimate_svm.Estimate()
+    e.dataset = FeatureDataset(rs.randn(len(labels), 4) + labels[:, np.newaxis], labels)
+    e.classes = 3
+    e.validate(folds=4, repeat=2, random_state=0)
+
+    assert len(e.splits) == 8
+    for rep in range(2):
+        splits = e.splits[rep*4:(rep+1)*4]
+        tests = np.concatenate([test_idx for train_idx, test_idx in splits])
+        assert len(np.unique(tests)) == len(tests) == 60
+        np.testing.assert_array_equal(np.bincount(labels[tests]), [20, 20, 20])
+        for train_idx, test_idx in splits:
+            assert len(np.intersect1d(train_idx, test_idx)) == 0
+            np.testing.assert_array_equal(np.union1d(train_idx, test_idx), np.sort(tests))
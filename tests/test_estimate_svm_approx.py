@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+import numpy as np
+import pytest
+
+import estimate_svm_approx
+from feature_dataset import FeatureDataset
+
+#==========================================================================
+@pytest.fixture
+def dataset():
+    rs = np.random.RandomState(0)
+    labels = np.repeat(np.arange(3), 100).astype(np.int8)
+    features = rs.randn(300, 8) + labels[:, np.newaxis]
+    return FeatureDataset(features, labels)
+
+#----------------------------------------------------------------------
+# random weights are shared among folds and features are standardized
+# with the training rows of each fold
+@pytest.mark.parametrize("approx", ["rff", "nystroem"])
+def test_fold_scaling(dataset, approx):
+    e = estimate_svm_approx.Estimate(approx=approx, n_components=50)
+    e.dataset = dataset
+    e.random_state = 0
+    x, y = dataset.features, dataset.labels
+
+    mappings = []
+    for train_idx, test_idx in [(np.arange(0, 300, 2), np.arange(1, 300, 2)),
+                                (np.arange(1, 300, 2), np.arange(0, 300, 2))]:
+        score, conf_mat = e.eval_indices(x, y, train_idx, test_idx)
+        np.testing.assert_allclose(e.scaler.mean_, x[train_idx].mean(axis=0))
+        mappings.append(e.model.named_steps['mapping'])
+        assert conf_mat.sum() == len(test_idx)
+        assert len(score) == 4 and score[2] > 0 and score[3] > 0
+
+    assert (mappings[0] is mappings[1]) == (approx == "rff")
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+import numpy as np
+import pytest
+from sklearn.metrics.pairwise import rbf_kernel
+from sklearn.preprocessing import StandardScaler
+
+import estimate_svm
+import estimate_svm_approx
+import estimate_svm_kernel
+from feature_dataset import FeatureDataset
+
+#==========================================================================
+# last column is constant
+@pytest.fixture
+def dataset():
+    rs = np.random.RandomState(0)
+    labels = np.repeat(np.arange(3), 40).astype(np.int8)
+    features = rs.randn(120, 6) + labels[:, np.newaxis]
+    features[:, -1] = 1.0
+    return FeatureDataset(features, labels)
+
+#----------------------------------------------------------------------
+def create_estimate(dataset, **params):
+    e = estimate_svm_kernel.Estimate(block_size=32, **params)
+    e.dataset = dataset
+    e.random_state = 0
+    return e
+
+#----------------------------------------------------------------------
+# Gram matrices of a fold are standardized with its training rows only
+def test_fold_scaling(dataset):
+    e = create_estimate(dataset)
+    x = e.validation_features()
+    assert x is dataset.features
+    train_idx, test_idx = np.arange(0, 120, 2), np.arange(1, 120, 2)
+
+    gram_train, gram_test = e.fold_gram(x[train_idx], x[test_idx])
+    scaler = StandardScaler().fit(x[train_idx])
+    gamma = 1.0 / 5
+    np.testing.assert_allclose(gram_train, rbf_kernel(scaler.transform(x[train_idx]), gamma=gamma))
+    np.testing.assert_allclose(gram_test, rbf_kernel(scaler.transform(x[test_idx]),
+                                                     scaler.transform(x[train_idx]), gamma=gamma))
+
+    score, conf_mat = e.eval_indices(x, dataset.labels, train_idx, test_idx)
+    assert conf_mat.sum() == len(test_idx)
+
+#----------------------------------------------------------------------
+# whole-dataset scaling shares one Gram matrix among folds
+def test_scale_whole_dataset(dataset):
+    e = create_estimate(dataset, scale_whole_dataset=True)
+    gram = e.validation_features()
+    assert gram.shape == (120, 120)
+    assert e.validation_features() is gram
+    scaler = StandardScaler().fit(dataset.features)
+    np.testing.assert_allclose(gram, rbf_kernel(scaler.transform(dataset.features), gamma=1.0 / 5))
+
+    train_idx, test_idx = np.arange(0, 120, 2), np.arange(1, 120, 2)
+    score, conf_mat = e.eval_indices(gram, dataset.labels, train_idx, test_idx)
+    assert conf_mat.sum() == len(test_idx)
+
+#----------------------------------------------------------------------
+# exact and approximate kernels and SVC use the same bandwidth
+def test_gamma(dataset):
+    scaler = StandardScaler().fit(dataset.features)
+    gamma = estimate_svm.kernel_gamma('scale', scaler)
+    assert gamma == 1.0 / 5
+
+    e = create_estimate(dataset)
+    e.fit()
+    assert e.model.gamma == gamma
+    x_scaled = scaler.transform(dataset.features)
+    assert gamma == pytest.approx(1.0 / (x_scaled.shape[1] * x_scaled.var()))
+
+    approx = estimate_svm_approx.Estimate(n_components=50)
+    approx.dataset = dataset
+    approx.random_state = 0
+    approx.fit()
+    assert approx.model.named_steps['mapping'].gamma == gamma
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+import numpy as np
+import pandas as pd
+import pytest
+
+import estimate_svm_split
+from estimate_svm_split import split_by, split_isolated
+from feature_dataset import FeatureDataset
+from vehicles import Vehicles
+
+#==========================================================================
+# vehicles of 3 recordings (vehicle ids restart in each recording)
+# with 3 feature rows per vehicle
+@pytest.fixture
+def estimate():
+    rs = np.random.RandomState(0)
+    data = []
+    for recording in range(3):
+        t0 = np.sort(rs.uniform(0, 600, 40))
+        data.append(pd.DataFrame({'t0': t0, 'v': 10.0, 'dir': rs.choice([0, 1], 40),
+                                  'type_id': rs.choice(3, 40), 'recording': recording,
+                                  'vehicle_id': np.arange(40)}))
+    veh = Vehicles(None)
+    veh.data = pd.concat(data, ignore_index=True)
+    veh.num_simul_successive()
+
+    rows = np.repeat(np.arange(len(veh.data)), 3)
+    labels = np.asarray(veh.data.type_id, dtype=np.int8)[rows]
+    e = estimate_svm_split.Estimate(vehicles=veh)
+    e.dataset = FeatureDataset(rs.randn(len(rows), 4) + labels[:, np.newaxis], labels,
+                               np.asarray(veh.data.vehicle_id)[rows],
+                               np.asarray(veh.data.recording)[rows],
+                               np.tile(np.arange(3), len(veh.data)))
+    e.classes = 3
+    return e
+
+#----------------------------------------------------------------------
+# vehicle data row of each dataset row
+def data_rows(e, rows):
+    ds = e.dataset
+    return np.asarray(ds.recording_ids)[rows] * 40 + np.asarray(ds.vehicle_ids)[rows]
+
+#----------------------------------------------------------------------
+# train and test rows share no vehicle and every vehicle brings all its rows
+def assert_groups(e, train_rows, test_rows, train_mask, test_mask):
+    train, test = data_rows(e, train_rows), data_rows(e, test_rows)
+    assert len(np.intersect1d(train, test)) == 0
+    for rows, mask in [(train, train_mask), (test, test_mask)]:
+        np.testing.assert_array_equal(np.unique(rows), np.flatnonzero(mask))
+        np.testing.assert_array_equal(np.bincount(rows, minlength=len(mask))[mask], 3)
+
+#==========================================================================
+# recordings are not shared between train and test rows
+def test_split_recording(estimate):
+    e = estimate
+    train_rows, test_rows = e.split_rows((dict(recording=[0, 1]), dict(recording=2)))
+    assert set(e.dataset.recording_ids[train_rows]) == {0, 1}
+    assert set(e.dataset.recording_ids[test_rows]) == {2}
+    data = e.vehicles.data
+    assert_groups(e, train_rows, test_rows, data.recording != 2, data.recording == 2)
+
+#----------------------------------------------------------------------
+# all training vehicles pass before the test vehicles
+def test_split_time(estimate):
+    e = estimate
+    train_rows, test_rows = e.split_rows((dict(t0=(0, 300), recording=0),
+                                          dict(t0=(300, np.inf), recording=0)))
+    t0 = np.asarray(e.vehicles.data.t0)
+    assert t0[data_rows(e, train_rows)].max() < 300 <= t0[data_rows(e, test_rows)].min()
+    data = e.vehicles.data
+    assert_groups(e, train_rows, test_rows, (data.t0 < 300) & (data.recording == 0),
+                  (data.t0 >= 300) & (data.recording == 0))
+
+#----------------------------------------------------------------------
+def test_split_isolated(estimate):
+    e = estimate
+    train_rows, test_rows = e.split_rows(split_isolated)
+    train_mask, test_mask = split_isolated(e.vehicles.data)
+    assert np.any(train_mask) and np.any(test_mask)
+    assert_groups(e, train_rows, test_rows, train_mask, test_mask)
+
+#----------------------------------------------------------------------
+# balanced rows of each repeat are drawn from train and test rows of the split
+@pytest.mark.filterwarnings("ignore::sklearn.exceptions.ConvergenceWarning")
+def test_validate_splits(estimate):
+    e = estimate
+    e.split = split_by(dict(recording=[0, 1]), dict(recording=2))
+    train_rows, test_rows = e.split_rows()
+    e.validate(repeat=2, random_state=0)
+
+    assert len(e.splits) == 2
+    for train_idx, test_idx in e.splits:
+        assert np.all(np.isin(train_idx, train_rows))
+        assert np.all(np.isin(test_idx, test_rows))
+        for idx in [train_idx, test_idx]:
+            counts = np.bincount(e.dataset.labels[idx], minlength=3)
+            assert np.all(counts == counts[0])
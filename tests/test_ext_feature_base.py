@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+import numpy as np
+import pytest
+
+pytest.importorskip("soundmap")
+
+from ext_feature_base import moving_average, block_average
+
+#==========================================================================
+# moving average by cumulative sum is the same as convolution of each column
+@pytest.mark.parametrize("dtype", [np.float32, np.float64, np.complex128])
+def test_moving_average(dtype):
+    rs = np.random.RandomState(0)
+    features = rs.randn(3, 40, 5).astype(dtype)
+    ret = moving_average(features, 7)
+    assert ret.dtype == features.dtype
+    ref = np.array([[np.convolve(col, np.ones(7) / 7, mode='valid') for col in f.T] for f in features])
+    np.testing.assert_allclose(ret, ref.transpose(0, 2, 1), rtol=1e-5, atol=1e-6)
+
+#----------------------------------------------------------------------
+# a vehicle with fewer frames than the window has no averaged frames
+@pytest.mark.parametrize("frames", [0, 3, 6])
+def test_average_short_input(frames):
+    features = np.ones((frames, 5), dtype=np.float32)
+    for average in [moving_average, block_average]:
+        ret = average(features, 7)
+        assert ret.shape == (0, 5)
+        assert ret.dtype == features.dtype
+    assert moving_average(np.ones((2, frames, 5)), 7).shape == (2, 0, 5)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+import os
+import numpy as np
+import pytest
+
+import fft_backend
+
+#==========================================================================
+# every backend gives numpy results for varying row counts
+@pytest.mark.parametrize("backend", fft_backend.available_backends(), ids=lambda b: b.name)
+def test_rfft(backend):
+    x = np.random.RandomState(0).randn(40, 512)
+    fft = backend(1)
+    for rows in [40, 39, 17, 1]:
+        np.testing.assert_allclose(fft.rfft(x[:rows]), np.fft.rfft(x[:rows]), rtol=0, atol=1e-10)
+
+#----------------------------------------------------------------------
+# probing backends does not change pyfftw global state
+def test_available_backends_has_no_side_effects():
+    pyfftw = pytest.importorskip("pyfftw")
+    import pyfftw.interfaces.cache
+    pyfftw.interfaces.cache.disable()
+    fft_backend.available_backends()
+    assert not pyfftw.interfaces.cache.is_enabled()
+
+#----------------------------------------------------------------------
+# wisdom is saved once at exit instead of at each new shape
+def test_wisdom_saved_at_exit(tmp_path):
+    pytest.importorskip("pyfftw")
+    wisdom_file = str(tmp_path / "wisdom.pkl")
+    fft = fft_backend.get_backend('pyfftw', 512, np.float64, 1, wisdom_file)
+    try:
+        for rows in [3, 5, 7]:
+            fft.rfft(np.zeros([rows, 512]))
+        assert not os.path.exists(wisdom_file)
+        fft_backend.save_wisdom_files()
+        assert os.path.exists(wisdom_file)
+    finally:
+        fft_backend.wisdom_files.discard(wisdom_file)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+import numpy as np
+import pytest
+
+pytest.importorskip("soundmap")
+
+from conftest import SAMP_RATE, FFT_LEN, FFT_SHIFT
+from sound_shift_fft import SoundShiftFFT, resolve_index
+
+#==========================================================================
+@pytest.fixture(scope="module")
+def sig(stereo):
+    s = SoundShiftFFT(stereo[0], stereo[1], SAMP_RATE, FFT_LEN, FFT_SHIFT, max_bin=128)
+    s.fft_all()
+    return s
+
+#----------------------------------------------------------------------
+# batched merge gives the same result as merging each vehicle
+def test_shift_merge_fft_batch(sig):
+    rs = np.random.RandomState(0)
+    samp_len = 150
+    time_deltas = rs.uniform(-2e-3, 2e-3, [8, samp_len])
+    offsets = np.r_[-20, rs.randint(0, sig.fft_data1.shape[0] - samp_len, 6),
+                    sig.fft_data1.shape[0] - samp_len + 20]
+
+    merged, mask = sig.shift_merge_fft_batch(time_deltas, offsets)
+
+    assert merged.shape == (8, samp_len, sig.fft_data1.shape[1])
+    for i in range(len(offsets)):
+        valid = np.flatnonzero(mask[i])
+        start = offsets[i] + valid[0]
+        ref = sig.shift_merge_fft(time_deltas[i, valid], start)
+        np.testing.assert_array_equal(merged[i, valid], ref)
+        assert np.all(merged[i, ~mask[i]] == 0)
+    assert not mask[0, 0] and not mask[-1, -1]
+
+#----------------------------------------------------------------------
+# offsets are resolved as np.arange(length)[key] without allocating the range
+@pytest.mark.parametrize("key", [slice(None), slice(3, 10), slice(-5, None), slice(None, None, -3),
+                                 slice(60, 70), 3, -1, np.int64(7), [1, -2, 5],
+                                 np.array([[1, 2], [3, -4]]), np.arange(50) % 3 == 0])
+def test_resolve_index(key):
+    ref = np.arange(50)[key]
+    ret = resolve_index(key, 50)
+    np.testing.assert_array_equal(ret, ref)
+    assert np.ndim(ret) == np.ndim(ref)
+
+#----------------------------------------------------------------------
+def test_resolve_index_long():
+    np.testing.assert_array_equal(resolve_index(slice(-3, None), 10**15), 10**15 + np.arange(-3, 0))
+    with pytest.raises(IndexError):
+        resolve_index([0, 50], 50)
+
+#----------------------------------------------------------------------
+# lazily calculated spectra are the ones calculated at once
+def test_lazy_spectrum(stereo, sig):
+    lazy = SoundShiftFFT(stereo[0], stereo[1], SAMP_RATE, FFT_LEN, FFT_SHIFT, max_bin=128)
+    lazy.fft_lazy()
+    for key in [slice(100, 180), 5, -1, np.array([7, 3, -2])]:
+        np.testing.assert_array_equal(lazy.fft_data1[key], sig.fft_data1[key])
+        np.testing.assert_array_equal(lazy.fft_data2[key, 10:20], sig.fft_data2[key, 10:20])
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("soundmap")
+
+from conftest import FFT_LEN, FFT_SHIFT
+from soundmap.wave_data import WaveData
+import ext_feature_shift_fft
+from stream_classify import RingSpectrum, StreamClassifier
+
+#==========================================================================
+# estimation stand-in keeping the features passed to predict
+class FeatureRecorder():
+    def __init__(self):
+        self.features = []
+        return
+
+    def predict(self, features):
+        self.features.append(features)
+        return np.zeros(len(features), dtype=np.int64)
+
+#----------------------------------------------------------------------
+def create_ext():
+    return ext_feature_shift_fft.ExtFeature(win=2.0, cutoff=3e3, fft_len=FFT_LEN, fft_shift=FFT_SHIFT)
+
+#----------------------------------------------------------------------
+# features of vehicles replayed in blocks are the same as offline features
+def test_replay_matches_offline(wavfile, vehicle_info):
+    offline = create_ext()
+    offline.load_sound(wavfile)
+
+    data = pd.read_csv(vehicle_info, sep="\t", index_col=0)
+    # vehicles whose windows are in the recording
+    half = offline.win / 2 + FFT_LEN / offline.sig.samp_rate
+    duration = offline.sig.max_offset * offline.samp_int
+    data = data.loc[(data.t0 > half) & (data.t0 < duration - half)]
+    assert len(data) > 10
+
+    wav = WaveData(wavfile, decimate=False)
+    left, right = np.array(wav.left), np.array(wav.right)
+    recorder = FeatureRecorder()
+    c = StreamClassifier(create_ext(), recorder, wav.sample_rate)
+    for t0, v in zip(data.t0, data.v):
+        c.add_event(t0, v)
+
+    block = 4800
+    for start in range(0, len(left), block):
+        c.feed(left[start:start+block], right[start:start+block])
+
+    assert len(c.results) == len(data)
+    for (t0, v), streamed in zip(zip(data.t0, data.v), recorder.features):
+        np.testing.assert_allclose(streamed, offline.feature(t0, v), rtol=1e-12, atol=0)
+
+#----------------------------------------------------------------------
+# ring buffer is indexed by absolute offsets like the whole history
+def test_ring_spectrum():
+    history = np.arange(1000 * 3, dtype=np.complex128).reshape(1000, 3)
+    ring = RingSpectrum(64, 3)
+    for start in range(0, 1000, 37):
+        ring.push(history[start:start+37])
+
+    for key in [slice(950, 990), slice(-10, None), -1, 999, np.array([940, -2, 970]), (slice(980, 990), 1)]:
+        np.testing.assert_array_equal(ring[key], history[key])
+    with pytest.raises(IndexError):
+        ring[900]
+    with pytest.raises(IndexError):
+        ring[1000]
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+import numpy as np
+import pytest
+
+pytest.importorskip("soundmap")
+
+from conftest import FFT_LEN, FFT_SHIFT
+import ext_feature_shift_fft
+from vehicles import Vehicles
+from feature_store import FeatureStore
+from feature_dataset import FeatureDataset
+
+#==========================================================================
+def create_ext(**kwargs):
+    return ext_feature_shift_fft.ExtFeature(win=2.0, cutoff=3e3, fft_len=FFT_LEN, fft_shift=FFT_SHIFT,
+                                            **kwargs)
+
+#----------------------------------------------------------------------
+def calc_dataset(wavfile, vehicle_info, ext_params=None, **veh_params):
+    ext = create_ext(**(ext_params or {}))
+    ext.load_sound(wavfile)
+    veh = Vehicles(vehicle_info, ext, **veh_params)
+    veh.load_data()
+    return veh.calc_dataset()
+
+#----------------------------------------------------------------------
+def assert_same(ds, ref):
+    for field in FeatureDataset.fields:
+        np.testing.assert_array_equal(getattr(ds, field), getattr(ref, field), err_msg=field)
+
+#----------------------------------------------------------------------
+# serial extraction with FFT of the whole recording at once (fft_all)
+@pytest.fixture(scope="module")
+def reference(wavfile, vehicle_info):
+    return calc_dataset(wavfile, vehicle_info, workers=1)
+
+#==========================================================================
+# features of each vehicle at once are the ones of the scalar path
+def test_batched_matches_scalar(wavfile, vehicle_info, reference):
+    ext = create_ext()
+    ext.load_sound(wavfile)
+    veh = Vehicles(vehicle_info, ext)
+    veh.load_data()
+
+    for i, (t0, v) in enumerate(zip(veh.data.t0, veh.data.v)):
+        rows = reference.vehicle_ids == i
+        np.testing.assert_array_equal(reference.features[rows], ext.feature(t0, v))
+    assert len(np.unique(reference.vehicle_ids)) == len(veh.data)
+
+#----------------------------------------------------------------------
+@pytest.mark.parametrize("params", [
+    dict(batch=1),
+    dict(batch=64),
+    dict(workers=3, pool='thread', batch=2),
+    dict(workers=2, pool='process', batch=3),
+    dict(workers=2, pool='process', batch=3, mmap_dir=True),
+    ], ids=["batch1", "batch64", "thread", "process", "process-mmap"])
+def test_pools(wavfile, vehicle_info, reference, tmp_path, params):
+    if params.get('mmap_dir'):
+        params = dict(params, mmap_dir=str(tmp_path))
+    assert_same(calc_dataset(wavfile, vehicle_info, **params), reference)
+    # the shared result file is removed while its mapping is in use
+    assert list(tmp_path.iterdir()) == []
+
+#----------------------------------------------------------------------
+@pytest.mark.parametrize("params", [
+    dict(fft_lazy=True),
+    dict(fft_lazy=True, workers=3, pool='thread'),
+    dict(fft_mem_limit=2**20),
+    dict(fft_mem_limit=2**20, fft_mmap_dir=True),
+    ], ids=["lazy", "lazy-thread", "chunked", "chunked-memmap"])
+def test_spectra(wavfile, vehicle_info, reference, tmp_path, params):
+    if params.get('fft_mmap_dir'):
+        params = dict(params, fft_mmap_dir=str(tmp_path))
+    workers = params.pop('workers', None)
+    pool = params.pop('pool', 'thread')
+    assert_same(calc_dataset(wavfile, vehicle_info, params, workers=workers, pool=pool), reference)
+
+#----------------------------------------------------------------------
+# FFT results cache is filled at the first run and loaded at the second one
+@pytest.mark.parametrize("cutoff", [None, 4e3], ids=["all-bins", "cache-cutoff"])
+def test_spectrum_cache(wavfile, vehicle_info, reference, tmp_path, cutoff):
+    params = dict(fft_cache_dir=str(tmp_path), fft_cache_cutoff=cutoff)
+    assert_same(calc_dataset(wavfile, vehicle_info, params), reference)
+    assert len(list(tmp_path.glob("*.npy"))) > 0
+    assert_same(calc_dataset(wavfile, vehicle_info, params), reference)
+
+#----------------------------------------------------------------------
+# cached FFT results of one backend are not reused by another backend
+def test_spectrum_cache_backend(wavfile, vehicle_info, reference, tmp_path):
+    pytest.importorskip("scipy.fft")
+    calc_dataset(wavfile, vehicle_info, dict(fft_cache_dir=str(tmp_path)))
+    entries = set(tmp_path.glob("*.npy"))
+    ds = calc_dataset(wavfile, vehicle_info, dict(fft_cache_dir=str(tmp_path), fft_backend='scipy'))
+    assert len(set(tmp_path.glob("*.npy")) - entries) == len(entries)
+    np.testing.assert_allclose(ds.features, reference.features, rtol=1e-12, atol=1e-9)
+
+#----------------------------------------------------------------------
+def test_scipy_backend(wavfile, vehicle_info, reference):
+    pytest.importorskip("scipy.fft")
+    ds = calc_dataset(wavfile, vehicle_info, dict(fft_backend='scipy', fft_workers=2))
+    np.testing.assert_allclose(ds.features, reference.features, rtol=1e-12, atol=1e-9)
+    np.testing.assert_array_equal(ds.vehicle_ids, reference.vehicle_ids)
+
+#----------------------------------------------------------------------
+# stored features are reused for all vehicles and for part of vehicles
+def test_feature_store(wavfile, vehicle_info, reference, tmp_path):
+    store = FeatureStore(str(tmp_path))
+
+    ext = create_ext()
+    ext.load_sound(wavfile)
+    veh = Vehicles(vehicle_info, ext, store=store)
+    veh.load_data()
+    # part of vehicles first, then all (stored and new ones)
+    part = veh.calc_dataset(veh.data.iloc[::3])
+    assert_same(part, FeatureDataset(*[getattr(reference, field)[np.isin(reference.vehicle_ids,
+                                                                      veh.data.index[::3])]
+                                       for field in FeatureDataset.fields]))
+    assert_same(veh.calc_dataset(), reference)
+    # all from store
+    assert_same(veh.calc_dataset(), reference)
+
+#----------------------------------------------------------------------
+# stored features are keyed by the FFT backend
+def test_feature_store_backend(wavfile, vehicle_info):
+    ext = create_ext()
+    ext.load_sound(wavfile)
+    assert ext.feature_params()['fft_backend'] == 'numpy'
+    scipy_ext = create_ext(fft_backend='scipy')
+    scipy_ext.load_sound(wavfile)
+    assert FeatureStore.params_hash(ext) != FeatureStore.params_hash(scipy_ext)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# 
+# Copyright (c) 2018-2024, Shigemi ISHIDA
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Institute nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE INSTITUTE AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE INSTITUTE OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+# 
+import numpy as np
+import pandas as pd
+import pytest
+
+from vehicles import Vehicles
+
+#==========================================================================
+# flags of the closer adjacent vehicle by the former row-wise implementation
+def closer_reference(data, simul_range):
+    data = data.copy()
+    dirs = np.array(data.dir, dtype=np.float64)
+    diff = np.diff(data.t0)
+    data['diff_pos'] = np.append(diff, np.inf)
+    data['diff_pre'] = np.insert(diff, 0, np.inf)
+    data['diff_closer'] = np.min(data[['diff_pos', 'diff_pre']], axis=1)
+    data['dir_pos'] = np.append(dirs[1:], np.nan)
+    data['dir_pre'] = np.insert(dirs[:-1], 0, np.nan)
+    data['dir_closer'] = data.apply(lambda x: x.dir_pos if x.diff_pos < x.diff_pre else x.dir_pre,
+                                    axis=1)
+    near = data.diff_closer < simul_range
+    return (np.array(near & (data.dir == data.dir_closer)),
+            np.array(near & (data.dir != data.dir_closer)))
+
+#----------------------------------------------------------------------
+# flags of all vehicles within simul_range seconds by pairwise loop
+def window_reference(data, simul_range):
+    t0, dirs = list(data.t0), list(data.dir)
+    is_simul = np.zeros(len(t0), dtype=bool)
+    is_succ  = np.zeros(len(t0), dtype=bool)
+    for i in range(len(t0)):
+        for j in range(len(t0)):
+            if i != j and abs(t0[j] - t0[i]) < simul_range:
+                if dirs[i] == dirs[j]:
+                    is_simul[i] = True
+                else:
+                    is_succ[i] = True
+    return is_simul, is_succ
+
+#----------------------------------------------------------------------
+# sorted passing times with ties, gaps equal to simul_range and missing directions
+def vehicles_data(n, seed):
+    rs = np.random.RandomState(seed)
+    t0 = np.sort(np.round(rs.uniform(0, n, n) * 2) / 2)
+    dirs = rs.choice([0.0, 1.0, np.nan], n, p=[0.45, 0.45, 0.1])
+    return pd.DataFrame({'t0': t0, 'dir': dirs})
+
+#----------------------------------------------------------------------
+def create_vehicles(data):
+    veh = Vehicles(None)
+    veh.data = data.copy()
+    return veh
+
+#==========================================================================
+@pytest.mark.parametrize("n", [1, 2, 50, 300])
+@pytest.mark.parametrize("window", [False, True], ids=["closer", "window"])
+def test_num_simul_successive(n, window):
+    data = vehicles_data(n, n)
+    for simul_range in [0.5, 1.0, 2.0]:
+        veh = create_vehicles(data)
+        ret = veh.num_simul_successive(simul_range, window=window)
+        reference = window_reference if window else closer_reference
+        is_simul, is_succ = reference(data, simul_range)
+        np.testing.assert_array_equal(veh.data.is_simul, is_simul)
+        np.testing.assert_array_equal(veh.data.is_succ, is_succ)
+        assert ret == {'simul': is_simul.sum(), 'succ': is_succ.sum()}
+
+#----------------------------------------------------------------------
+# equally close neighbors: the previous vehicle is the closer one
+def test_closer_tie():
+    data = pd.DataFrame({'t0': [0.0, 1.0, 2.0, 2.0], 'dir': [0.0, 1.0, 0.0, np.nan]})
+    veh = create_vehicles(data)
+    veh.num_simul_successive(1.5)
+    np.testing.assert_array_equal(veh.data.is_simul, [False, False, False, False])
+    np.testing.assert_array_equal(veh.data.is_succ, [True, True, True, True])
+    np.testing.assert_array_equal(closer_reference(data, 1.5)[1], veh.data.is_succ)
@@ -27,17 +27,57 @@
 # SUCH DAMAGE.
 # 
 
+import os
+import tempfile
+import multiprocessing
+import concurrent.futures
 import numpy as np
 import pandas as pd
 
+from feature_dataset import FeatureDataset
+
+# Vehicles instance, shared result memmaps and vehicle columns
+# inherited by forked worker processes
+_worker = None
+
+#--------------------------------------------------------------------------
+# calculate features of vehicles start..stop-1 in a worker process
+#   only (start, stop) is sent to the worker;
+#   features and masks are written directly into the shared result memmaps
+def _calc_chunk_in_process(chunk):
+    veh, result, mask, t0, v = _worker
+    veh.calc_chunk(result, mask, t0, v, *chunk)
+    return
+
 #==========================================================================
 class Vehicles():
-    def __init__(self, datafile, extract_feature=None):
+    def __init__(self, datafile, extract_feature=None,
+                 workers=None,   # number of workers for feature extraction (None or 1: serial)
+                 pool='thread',  # 'thread' or 'process' pool for feature extraction
+                 mmap_dir=None,  # directory for result memmap shared with worker processes
+                 batch=4,        # number of vehicles whose features are extracted at once
+                 store=None,     # FeatureStore to reuse features calculated before
+                 vehicle_types=None, # vehicle type names in type_id order (None: order of appearance)
+                 recording=0,    # recording id stored in FeatureDataset
+                 ):
         self.datafile = datafile
         self.data = None
+        self.workers  = workers
+        self.pool     = pool
+        self.mmap_dir = mmap_dir
+        self.batch    = batch
+        self.store    = store
+        self.vehicle_types = vehicle_types
+        self.recording     = recording
 
+        self.ext = extract_feature
+        self.extract_feature = None
+        self.extract_features = None
+        self.prefetch = None
         if extract_feature is not None:
             self.extract_feature = extract_feature.feature
+            self.extract_features = extract_feature.features
+            self.prefetch = extract_feature.prefetch
         return
 
     #----------------------------------------------------------------------
@@ -57,7 +97,9 @@ class Vehicles():
     def assign_type_ids(self):
         # type is described by type_id instead of type name such as 'normal' and 'bike'
         self.data['type_id'] = -1
-        vehicle_types = self.data.type.unique()
+        vehicle_types = self.vehicle_types
+        if vehicle_types is None:
+            vehicle_types = self.data.type.unique()
         self.type_ids = dict(zip(range(len(vehicle_types)), vehicle_types))
         for type_id in self.type_ids.keys():
             self.data.loc[self.data.type == self.type_ids[type_id], 'type_id'] = type_id
@@ -65,27 +107,41 @@ class Vehicles():
         return
 
     #----------------------------------------------------------------------
-    def num_simul_successive(self, simul_range=2):
-        diff = np.diff(self.data.t0)
-        self.data['diff_pos'] = np.append(diff, np.inf)
-        self.data['diff_pre'] = np.insert(diff, 0, np.inf)
-        self.data['diff_closer'] = np.min(self.data[['diff_pos', 'diff_pre']], axis=1)
+    # index range [lo, hi) of vehicles within simul_range seconds from each t
+    #   t0 must be sorted
+    @staticmethod
+    def neighbor_range(t0, t, simul_range):
+        lo = np.searchsorted(t0, t - simul_range, side='right')
+        hi = np.searchsorted(t0, t + simul_range, side='left')
+        return lo, hi
 
+    #----------------------------------------------------------------------
+    # find vehicles passing simultaneously (same direction) or successively
+    # (opposite direction) within simul_range seconds
+    #   window=False: only the closer of the adjacent vehicles is checked
+    #   window=True:  all vehicles within simul_range seconds are checked
+    def num_simul_successive(self, simul_range=2, window=False):
+        t0   = np.array(self.data.t0, dtype=np.float64)
         dirs = np.array(self.data.dir)
-        self.data['dir_pos'] = np.append(dirs[1:], np.nan)
-        self.data['dir_pre'] = np.insert(dirs[:-1], 0, np.nan)
-        self.data['dir_closer'] = self.data.apply(
-            lambda x: x.dir_pos if x.diff_pos < x.diff_pre else x.dir_pre,
-            axis=1)
 
-        # extract simul or successive
-        self.data['is_simul'] = False
-        self.data['is_succ']  = False
-        self.data.loc[(self.data.diff_closer < simul_range) & (self.data.dir == self.data.dir_closer), 'is_simul'] = True
-        self.data.loc[(self.data.diff_closer < simul_range) & (self.data.dir != self.data.dir_closer), 'is_succ'] = True
+        if window:
+            is_simul, is_succ = self.window_simul_successive(t0, dirs, simul_range)
+        else:
+            diff = np.diff(t0)
+            diff_pos = np.append(diff, np.inf)
+            diff_pre = np.insert(diff, 0, np.inf)
+
+            # index of the closer adjacent vehicle (previous one if equally close)
+            idx = np.arange(len(t0))
+            closer = np.clip(np.where(diff_pos < diff_pre, idx + 1, idx - 1), 0, max(len(t0) - 1, 0))
+            near = np.minimum(diff_pos, diff_pre) < simul_range
+            same = dirs == dirs[closer]
+
+            is_simul = near & same
+            is_succ  = near & ~same
 
-        # drop unnecessary columns
-        self.data = self.data.drop(['diff_pos', 'diff_pre', 'diff_closer', 'dir_pos', 'dir_pre', 'dir_closer'], axis=1)
+        self.data['is_simul'] = is_simul
+        self.data['is_succ']  = is_succ
 
         ret = {}
         ret['simul'] = self.data.is_simul.sum()
@@ -93,45 +149,191 @@ class Vehicles():
 
         return ret
 
+    #----------------------------------------------------------------------
+    # simultaneous/successive flags with all vehicles within simul_range seconds
+    #   neighbors are counted by binary search on t0 of all vehicles
+    #   and t0 of vehicles in the same direction
+    def window_simul_successive(self, t0, dirs, simul_range):
+        lo, hi = self.neighbor_range(t0, t0, simul_range)
+        n_near = hi - lo - 1
+
+        # vehicles without direction have no vehicles in the same direction
+        codes = pd.factorize(dirs)[0]
+        n_same = np.zeros(len(t0), dtype=np.int64)
+        for code in np.unique(codes[codes >= 0]):
+            sel = codes == code
+            lo, hi = self.neighbor_range(t0[sel], t0[sel], simul_range)
+            n_same[sel] = hi - lo - 1
+
+        return n_same > 0, n_near - n_same > 0
+
     #----------------------------------------------------------------------
     def calc_feature(self, t0, v, label):
         fet = self.extract_feature(t0, v)
 
-        lab = np.empty([fet.shape[0], 1])
+        lab = np.empty([fet.shape[0], 1], dtype=fet.dtype)
         lab[:] = label
 
         return np.c_[fet, lab]
 
     #----------------------------------------------------------------------
+    # columnar view of vehicles in data (default: all vehicles)
+    #   vehicle id is the row index in self.data
+    def columns(self, data=None):
+        if data is None:
+            data = self.data
+        return {'id':      np.array(data.index, dtype=np.int64),
+                't0':      np.array(data.t0, dtype=np.float64),
+                'v':       np.array(data.v, dtype=np.float64),
+                'type_id': np.array(data.type_id, dtype=np.int64),
+                }
+
+    #----------------------------------------------------------------------
+    # feature matrix of vehicles in data (default: all vehicles)
+    #   each row is a feature vector followed by type_id
     def calc_features(self, data=None):
+        if self.extract_feature is None:
+            return None
+        return self.calc_dataset(data).matrix()
+
+    #----------------------------------------------------------------------
+    # FeatureDataset of vehicles in data (default: all vehicles)
+    #   rows of a vehicle near the edges of the recording are dropped
+    #   if their windows are out of the recording
+    def calc_dataset(self, data=None):
         if self.extract_feature is None:
             return None
 
         if self.data is None:
             self.load_data()
 
-        if data is None:
-            data = self.data
+        cols = self.columns(data)
+
+        # N x rows x bins features and N x rows validity mask
+        if self.store is not None and self.ext.wavfile is not None:
+            features, mask = self.stored_feature_tensor(cols)
+        else:
+            # calculate FFT around the vehicles if needed
+            self.prefetch(cols['t0'])
+            features, mask = self.calc_feature_tensor(cols)
+
+        # keep valid rows
+        rows = mask.sum(axis=1)
+        label_dtype = FeatureDataset.label_dtype(len(self.type_ids))
+        return FeatureDataset(features[mask],
+                              np.repeat(cols['type_id'], rows).astype(label_dtype),
+                              vehicle_ids   = np.repeat(cols['id'], rows),
+                              recording_ids = np.full(rows.sum(), self.recording, dtype=np.int64),
+                              frames        = np.nonzero(mask)[1],
+                              )
 
-        # calculate feature for first vehicle
-        ret = self.calc_feature(data.iloc[0].t0,
-                                data.iloc[0].v,
-                                data.iloc[0].type_id)
-        # retrive the length of feature_matrix
-        ret_len = ret.shape[0]
+    #----------------------------------------------------------------------
+    # features of all vehicles in cols reusing the ones in store
+    #   features of vehicles not in store are calculated and appended to store
+    def stored_feature_tensor(self, cols):
+        found, features, mask = self.store.load(self.ext.wavfile, self.ext, cols['t0'], cols['v'])
+        if found.all():
+            return features, mask
+
+        missing = {key: col[~found] for key, col in cols.items()}
+        self.prefetch(missing['t0'])
+        ret, ret_mask = self.calc_feature_tensor(missing)
+        self.store.store(self.ext.wavfile, self.ext, missing['t0'], missing['v'], ret, ret_mask)
+
+        if features is None:
+            return ret, ret_mask
+        features[~found] = ret
+        mask[~found]     = ret_mask
+        return features, mask
+
+    #----------------------------------------------------------------------
+    # features of all vehicles in cols as (N x rows x bins array, N x rows mask)
+    #   features of at most batch vehicles are extracted at once
+    def calc_feature_tensor(self, cols):
+        t0 = cols['t0']
+        v  = cols['v']
+
+        # calculate features for first chunk
+        first = min(self.batch, len(t0))
+        ret, ret_mask = self.extract_features(t0[:first], v[:first])
         # reserve space for features
-        result = np.empty([ret_len*len(data), ret.shape[1]])
-
-        # store the first feature
-        result[0:ret_len,:] = ret
-        # calculate and store feature for remaining vehicles
-        for i in range(1,len(data)):
-            ret = self.calc_feature(data.iloc[i].t0,
-                                    data.iloc[i].v,
-                                    data.iloc[i].type_id)
-            result[ret_len*i:ret_len*(i+1),:] = ret
-
-        return result
+        #   worker processes write into memmaps shared with this process
+        shared = len(t0) > first and self.process_pool()
+        result = self.empty((len(t0),) + ret.shape[1:], ret.dtype, shared)
+        mask   = self.empty((len(t0),) + ret_mask.shape[1:], bool, shared)
+        # store the first chunk
+        result[:first] = ret
+        mask[:first]   = ret_mask
+
+        # calculate and store features for remaining vehicles
+        if self.workers is None or self.workers <= 1:
+            self.calc_chunk(result, mask, t0, v, first, len(t0))
+        else:
+            self.calc_parallel(result, mask, t0, v, first)
+
+        return result, mask
+
+    #----------------------------------------------------------------------
+    # True if features are extracted in forked worker processes
+    def process_pool(self):
+        if self.workers is None or self.workers <= 1 or self.pool != 'process':
+            return False
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            print("process pool needs fork; thread pool is used instead")
+            return False
+        return True
+
+    #----------------------------------------------------------------------
+    # empty array, or memmap shared with forked worker processes
+    #   the temporary file in mmap_dir is removed at once;
+    #   its mapping is kept until the returned array is released
+    def empty(self, shape, dtype, shared=False):
+        if not shared:
+            return np.empty(shape, dtype=dtype)
+        fd, filename = tempfile.mkstemp(suffix=".npy", dir=self.mmap_dir)
+        os.close(fd)
+        try:
+            return np.lib.format.open_memmap(filename, mode='w+', dtype=dtype, shape=shape)
+        finally:
+            os.remove(filename)
+
+    #----------------------------------------------------------------------
+    # calculate and store features of vehicles start..stop-1 in batches
+    def calc_chunk(self, result, mask, t0, v, start, stop):
+        for i in range(start, stop, self.batch):
+            j = min(i + self.batch, stop)
+            result[i:j], mask[i:j] = self.extract_features(t0[i:j], v[i:j])
+        return
+
+    #----------------------------------------------------------------------
+    # calculate features of vehicles first.. in parallel
+    #   about 4 chunks per worker to balance the load
+    #   threads share the spectra and result in memory
+    #   forked processes share the spectra by copy-on-write (or memmap)
+    #   and write into result memmaps allocated by empty()
+    def calc_parallel(self, result, mask, t0, v, first):
+        n = len(t0) - first
+        if n <= 0:
+            return
+        size = max(-(-n // (self.workers*4)), 1)
+        chunks = [(start, min(start + size, len(t0))) for start in range(first, len(t0), size)]
+
+        # result is a memmap only for a process pool (see empty())
+        if not isinstance(result, np.memmap):
+            with concurrent.futures.ThreadPoolExecutor(self.workers) as ex:
+                list(ex.map(lambda chunk: self.calc_chunk(result, mask, t0, v, *chunk), chunks))
+            return
+
+        global _worker
+        try:
+            _worker = (self, result, mask, t0, v)
+            ctx = multiprocessing.get_context('fork')
+            with concurrent.futures.ProcessPoolExecutor(self.workers, mp_context=ctx) as ex:
+                list(ex.map(_calc_chunk_in_process, chunks))
+        finally:
+            _worker = None
+
+        return
 
 #==========================================================================
 if __name__ == '__main__':